@@ -1,24 +1,64 @@
+import argparse
+import os
+import signal
 import sys
 import threading
-from PyQt5.QtWidgets import QApplication
-from main import MainWindow
-from receipt_template import app as flask_app
+from receipt_template import (app as flask_app, get_print_queue, get_receipt_template, get_config, submit_receipt,
+                              default_printer)
+from http_server import PrintServer
+from submission_channel import SubmissionChannel, DEFAULT_CHANNEL_CONFIG
 
-def run_flask():
-    flask_app.run(host='0.0.0.0', port=1717)
+def create_channel(print_queue, host=None, port=None):
+    config = dict(DEFAULT_CHANNEL_CONFIG, **get_config().get('channel', {}))
+    if not config.pop('enabled'):
+        return None
+    config.update({k: v for k, v in (('host', host), ('port', port)) if v is not None})
+    return SubmissionChannel(submit_receipt, print_queue, default_printer=default_printer, **config)
 
-class MosysPrinterWindow(MainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle('Mosys Printer')  # Set the window title here
+def create_server(host=None, port=None, channel_port=None):
+    print_queue = get_print_queue()
+    return PrintServer(flask_app, print_queue, channel=create_channel(print_queue, host, channel_port),
+                       **dict(get_config().get('server', {}), host=host, port=port))
 
-if __name__ == "__main__":
-    # Start Flask server in a separate thread
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+def run_gui(server, offscreen=False):
+    if offscreen:
+        # Render the window without a display, e.g. on a server or in CI
+        os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    # Qt is only imported when the window is actually shown
+    from PyQt5.QtWidgets import QApplication
+    from main import MainWindow
+
+    class MosysPrinterWindow(MainWindow):
+        def __init__(self):
+            super().__init__()
+            self.setWindowTitle('Mosys Printer')  # Set the window title here
+
+    # Start the HTTP server on its own worker threads
+    server.start()
 
     # Run PyQt5 application
     qt_app = QApplication(sys.argv)
+    qt_app.aboutToQuit.connect(server.stop)
     main_window = MosysPrinterWindow()
     main_window.show()
-    sys.exit(qt_app.exec_())
\ No newline at end of file
+    return qt_app.exec_()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mosys Printer server")
+    parser.add_argument('--headless', action='store_true', help="run only the print server, without the Qt window")
+    parser.add_argument('--offscreen', action='store_true',
+                        help="run the Qt window on the offscreen platform, without a display")
+    parser.add_argument('--host', help="listen address (default from mosys.json or 0.0.0.0)")
+    parser.add_argument('--port', type=int, help="listen port (default from mosys.json or 1717)")
+    parser.add_argument('--channel-port', type=int,
+                        help="port of the NDJSON submission channel (default from mosys.json or 1718)")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.channel_port)
+    # Load the template while the server starts instead of on the first /print
+    threading.Thread(target=get_receipt_template, name="template-warmup", daemon=True).start()
+    if args.headless:
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        server.serve_forever()
+    else:
+        sys.exit(run_gui(server, args.offscreen))
@@ -0,0 +1,93 @@
+"""Benchmark for parsing /print payloads: the old form parser against the schema validator.
+
+Every case starts from the request body as it arrives, so decoding the
+form or the JSON body is part of what is measured. Run from the project
+root:
+
+    python benchmarks/bench_parse.py
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.wrappers import Request
+
+from receipt_schema import ReceiptValidator, RECEIPT_FIELDS
+from bench_render import make_receipt
+
+
+def legacy_parse(fields):
+    """The /print parser before the schema validator: json.loads, then a second pass converting amounts."""
+    data = {name: fields.get(name) for name in RECEIPT_FIELDS}
+    items = fields.get('items', '[]')
+    if isinstance(items, str):
+        items = json.loads(items)
+    data['items'] = items
+    if not data['nama_toko']:
+        raise ValueError("No data provided")
+    for item in data['items']:
+        item['harga'] = float(item['harga'])
+        item['diskon'] = float(item['diskon'])
+        item['total_harga'] = float(item['total_harga'])
+    return data
+
+
+def form_body(item_count):
+    receipt = make_receipt(item_count)
+    receipt['items'] = json.dumps(receipt['items'])
+    return urlencode(receipt)
+
+
+def json_body(item_count):
+    return json.dumps(make_receipt(item_count))
+
+
+def decode_form(body):
+    """``request.form`` of a /print request with ``body``; items is still a JSON string."""
+    return Request.from_values(data=body, content_type='application/x-www-form-urlencoded').form
+
+
+def decode_json(body):
+    """``request.get_json()`` of a /print request with ``body``."""
+    return Request.from_values(data=body, content_type='application/json').get_json()
+
+
+def bench(cases, item_count, min_time=2.0):
+    """Parses per second of each ``(name, parse, make_body)`` case, from its fastest parse.
+
+    The cases parse in turns for ``min_time`` seconds, so a busy moment on
+    the machine slows all of them alike. Also returns the peak memory one
+    parse allocates, decoding included.
+    """
+    bodies = {name: make_body(item_count) for name, _, make_body in cases}
+    fastest = {name: float('inf') for name, _, _ in cases}
+    end = time.perf_counter() + min_time
+    while time.perf_counter() < end:
+        for name, parse, _ in cases:
+            start = time.perf_counter()
+            parse(bodies[name])
+            fastest[name] = min(fastest[name], time.perf_counter() - start)
+    peaks = {}
+    for name, parse, _ in cases:
+        tracemalloc.start()
+        parse(bodies[name])
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {name: (1 / fastest[name], peaks[name]) for name, _, _ in cases}
+
+
+if __name__ == '__main__':
+    validator = ReceiptValidator()
+    cases = (
+        ('legacy form', lambda body: legacy_parse(decode_form(body)), form_body),
+        ('schema form', lambda body: validator.validate(decode_form(body)), form_body),
+        ('schema json', lambda body: validator.validate(decode_json(body)), json_body)
+    )
+    for item_count in (5, 500):
+        for name, (rate, peak) in bench(cases, item_count).items():
+            print(f"{name:<12} {item_count:>4} items: {rate:>10.0f} parses/sec, peak {peak / 1024:>7.1f} KiB")
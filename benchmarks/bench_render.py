@@ -0,0 +1,117 @@
+"""Micro-benchmark for ReceiptTemplate.generate_receipt and render_document.
+
+Compares the old renderer with ``CompiledTemplate`` on the same 80mm
+``item_format`` template. Both format every section and item line with
+``str.format``; the compiled template checks its format strings once when
+it is saved and adds wide-character truncation and styles, so it should
+stay about as fast as the old renderer. Run from the project root:
+
+    python benchmarks/bench_render.py
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_template import DEFAULT_TEMPLATE, ReceiptTemplate
+from rupiah import format_rupiah
+
+
+def make_receipt(item_count):
+    return {
+        'nama_toko': 'Toko ABC',
+        'alamat_toko': 'Jl. Contoh No. 123',
+        'no_hp': '08123456789',
+        'nama_kasir': 'John Doe',
+        'code': '12121211',
+        'tanggal': '2024-09-02 15:30:00',
+        'items': [
+            {
+                'nama_produk': f'Produk {i} dengan nama yang cukup panjang',
+                'qty': i % 5 + 1,
+                'satuan': 'pcs',
+                'harga': 10000.0 + i * 250,
+                'diskon': float(i % 3 * 500),
+                'total_harga': 10000.0 + i * 250 - i % 3 * 500
+            }
+            for i in range(item_count)
+        ],
+        'notes': 'Terima kasih telah berbelanja!'
+    }
+
+
+def legacy_generate_receipt(template, data):
+    """generate_receipt before compiled templates, without the format string checks.
+
+    It used the locale-based format_rupiah, which is replaced by the current
+    one here so only the template rendering is compared.
+    """
+    receipt = []
+    paper_width = 48
+    receipt.append(template['header_format'].format(
+        nama_toko=data.get('nama_toko', ''),
+        alamat_toko=data.get('alamat_toko', ''),
+        no_hp=data.get('no_hp', '')
+    ))
+    receipt.append(template['cashier_format'].format(nama_kasir=data.get('nama_kasir', '')))
+    receipt.append(template['code_format'].format(code=data.get('code', '')))
+    receipt.append(template['date_format'].format(tanggal=data.get('tanggal', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
+
+    receipt.append('-' * paper_width)
+    for item in data.get('items', []):
+        formatted_item = item.copy()
+        name = item['nama_produk']
+        formatted_item['nama_produk'] = name[:27] + '...' if len(name) > 30 else name
+        formatted_item['harga'] = format_rupiah(item['harga'])
+        formatted_item['diskon'] = format_rupiah(item['diskon'])
+        formatted_item['total_harga'] = format_rupiah(item['total_harga'])
+        receipt.append(template['item_format'].format(**formatted_item))
+    receipt.append('-' * paper_width)
+
+    total_item = sum(item['qty'] for item in data.get('items', []))
+    total_diskon = sum(item['diskon'] for item in data.get('items', []))
+    total_harga = sum(item['total_harga'] for item in data.get('items', []))
+    summary = template['summary_format'].format(
+        total_item=total_item,
+        total_diskon=format_rupiah(total_diskon),
+        total_harga=format_rupiah(total_harga)
+    )
+    receipt.extend(summary.split('\n'))
+
+    if 'notes' in data:
+        footer = template['footer_format'].format(notes=data['notes'])
+        receipt.extend(footer[i:i + paper_width] for i in range(0, len(footer), paper_width))
+    return '\n'.join(receipt)
+
+
+def bench(cases, item_count, min_time=2.0):
+    """Receipts per second of each ``(name, render)`` case, from its fastest render.
+
+    The cases render in turns for ``min_time`` seconds, so a busy moment on
+    the machine slows all of them alike and the fastest call of each is
+    what the code itself costs.
+    """
+    data = make_receipt(item_count)
+    fastest = {name: float('inf') for name, _ in cases}
+    end = time.perf_counter() + min_time
+    while time.perf_counter() < end:
+        for name, render in cases:
+            start = time.perf_counter()
+            render(data)
+            fastest[name] = min(fastest[name], time.perf_counter() - start)
+    return {name: 1 / seconds for name, seconds in fastest.items()}
+
+
+if __name__ == '__main__':
+    settings = dict(DEFAULT_TEMPLATE, paper_size='80mm', item_columns=None)
+    template = ReceiptTemplate().compile('bench', settings, images=False)
+    cases = (
+        ('legacy text', lambda data: legacy_generate_receipt(settings, data)),
+        ('compiled text', template.generate_receipt),
+        ('compiled escpos', template.render_document)
+    )
+    for item_count in (5, 200):
+        for name, rate in bench(cases, item_count).items():
+            print(f"{name:<15} {item_count:>4} items: {rate:>10.0f} receipts/sec")
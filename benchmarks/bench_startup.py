@@ -0,0 +1,82 @@
+"""Cold start benchmark for the headless print server.
+
+Starts ``app_launcher.py --headless`` in a fresh process (in a temporary
+working directory) and measures the time until ``GET /health`` answers and
+until the first ``/print`` is accepted. Also checks that PyQt5 is not
+imported in headless mode.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, data=None, deadline=30):
+    end = time.perf_counter() + deadline
+    while time.perf_counter() < end:
+        try:
+            with urllib.request.urlopen(url, data=data, timeout=1) as response:
+                return response.status
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    raise TimeoutError(url)
+
+
+def run_once(workdir):
+    port = free_port()
+    check_qt = "import sys, runpy; sys.argv = ['app_launcher.py', '--headless', '--host', '127.0.0.1', '--port', '%d']; " \
+               "import atexit; atexit.register(lambda: open('qt_loaded', 'w').write(str('PyQt5' in sys.modules))); " \
+               "runpy.run_path(%r, run_name='__main__')" % (port, os.path.join(ROOT, 'app_launcher.py'))
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', check_qt], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(f'http://127.0.0.1:{port}/health')
+        ready = time.perf_counter() - start
+        form = urlencode({'nama_toko': 'Toko', 'code': f'START-{port}', 'items': '[]'}).encode()
+        wait_for(f'http://127.0.0.1:{port}/print', data=form)
+        first_print = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(30)
+    with open(os.path.join(workdir, 'qt_loaded')) as f:
+        qt_loaded = f.read() == 'True'
+    return ready, first_print, qt_loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='mosys-startup-')
+    with open(os.path.join(workdir, 'mosys.json'), 'w') as f:
+        json.dump({'active_printer': 'sink', 'printers': {'sink': {'transport': 'file', 'path': 'sink.bin'}}}, f)
+
+    results = [run_once(workdir) for _ in range(args.runs)]
+    for index, (ready, first_print, qt_loaded) in enumerate(results, 1):
+        print(f"run {index}: /health after {ready * 1000:.0f} ms, first /print accepted after "
+              f"{first_print * 1000:.0f} ms, PyQt5 imported: {qt_loaded}")
+    print(f"best /health: {min(r[0] for r in results) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
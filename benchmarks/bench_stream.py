@@ -0,0 +1,53 @@
+"""Benchmark for long receipts: render_document against streaming with iter_document.
+
+Run from the project root:
+
+    python benchmarks/bench_stream.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_template import ReceiptTemplate
+from bench_render import make_receipt
+
+
+def first_chunk_time(template, data):
+    start = time.perf_counter()
+    next(template.iter_document(data))
+    return time.perf_counter() - start
+
+
+def render_time(template, data):
+    start = time.perf_counter()
+    template.render_document(data)
+    return time.perf_counter() - start
+
+
+def peak_memory(render):
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def stream(template, data):
+    for _ in template.iter_document(data):
+        pass
+
+
+if __name__ == '__main__':
+    template = ReceiptTemplate().get()
+    # Fill the format_rupiah cache first, it is bounded and would otherwise count as growth
+    stream(template, make_receipt(5000))
+    for item_count in (100, 5000, 50000):
+        data = make_receipt(item_count)
+        full_peak = peak_memory(lambda: template.render_document(data))
+        stream_peak = peak_memory(lambda: stream(template, data))
+        print(f"{item_count:>6} items: first byte after {first_chunk_time(template, data) * 1000:>7.2f} ms "
+              f"(full render {render_time(template, data) * 1000:>8.2f} ms), "
+              f"peak {stream_peak / 1024:>6.0f} KiB streamed vs {full_peak / 1024:>7.0f} KiB")
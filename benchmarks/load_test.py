@@ -0,0 +1,158 @@
+"""HTTP load test for /print against a stand-in network printer.
+
+Starts a local TCP sink that acts as a raw port 9100 printer, serves the
+app in a temporary working directory, then sends /print requests from
+several keep-alive clients and reports requests/sec, latency percentiles
+and how many connections the clients opened (one per client when every
+connection is kept alive).
+
+    python benchmarks/load_test.py --server pooled --clients 16 --requests 2000
+    python benchmarks/load_test.py --server dev
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class StandInPrinter:
+    """Accepts raw TCP connections and discards the received bytes."""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.bytes_received = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self._drain, args=(conn,), daemon=True).start()
+
+    def _drain(self, conn):
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            self.bytes_received += len(data)
+        conn.close()
+
+
+class CountingConnection(http.client.HTTPConnection):
+    """HTTP connection counting how often it connects; it reconnects whenever the server closes it."""
+
+    opened = 0
+    _lock = threading.Lock()
+
+    def connect(self):
+        with CountingConnection._lock:
+            CountingConnection.opened += 1
+        super().connect()
+
+
+def receipt_form(index, item_count):
+    items = [{'nama_produk': f'Produk {i}', 'qty': 1, 'satuan': 'pcs',
+              'harga': 10000, 'diskon': 0, 'total_harga': 10000} for i in range(item_count)]
+    return urlencode({'nama_toko': 'Toko ABC', 'alamat_toko': 'Jl. Contoh No. 123', 'no_hp': '0812',
+                      'nama_kasir': 'Kasir', 'code': f'LOAD-{index}', 'tanggal': '2024-09-02 15:30:00',
+                      'items': json.dumps(items), 'notes': 'Terima kasih'})
+
+
+def client(port, indexes, item_count, latencies, errors):
+    conn = CountingConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    for index in indexes:
+        body = receipt_form(index, item_count)
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/print', body, headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 202:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = CountingConnection('127.0.0.1', port, timeout=30)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=('pooled', 'dev'), default='pooled')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    printer = StandInPrinter()
+    workdir = tempfile.mkdtemp(prefix='mosys-load-')
+    os.chdir(workdir)
+    with open('mosys.json', 'w') as f:
+        json.dump({'active_printer': 'standin', 'queue_max_depth': args.requests,
+                   'idempotency_window': 0,
+                   'printers': {'standin': {'transport': 'tcp', 'host': '127.0.0.1', 'port': printer.port}}}, f)
+
+    import logging
+    import receipt_template
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.server == 'pooled':
+        from http_server import PrintServer
+        server = PrintServer(receipt_template.app, receipt_template.get_print_queue(),
+                             host='127.0.0.1', port=0, threads=args.threads).start()
+        port = server.port
+    else:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, receipt_template.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+
+    latencies = []
+    errors = []
+    per_client = [range(i, args.requests, args.clients) for i in range(args.clients)]
+    threads = [threading.Thread(target=client, args=(port, indexes, args.items, latencies, errors))
+               for indexes in per_client]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    drain_start = time.perf_counter()
+    if args.server == 'pooled':
+        server.stop()
+    else:
+        server.shutdown()
+        receipt_template.get_print_queue().drain()
+    drain_time = time.perf_counter() - drain_start
+
+    print(f"server={args.server} clients={args.clients} requests={args.requests} items={args.items}")
+    print(f"throughput: {len(latencies) / elapsed:.0f} requests/sec")
+    print(f"latency p50: {percentile(latencies, 50) * 1000:.1f} ms  "
+          f"p99: {percentile(latencies, 99) * 1000:.1f} ms  max: {max(latencies) * 1000:.1f} ms")
+    print(f"errors: {len(errors)}  connections: {CountingConnection.opened}  "
+          f"printer bytes: {printer.bytes_received}  shutdown: {drain_time:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Benchmark and regression suite that needs no printer.
+
+Render micro-benchmarks for the 58mm and 80mm templates at several item
+counts, and HTTP scenarios that replay a recorded request log against the
+production server printing to a ``SimulatedPrinter`` (with print latency
+and injected failures). Each scenario runs in its own process and working
+directory. Run from the project root:
+
+    python benchmarks/regression.py --output report.json
+    python benchmarks/regression.py --baseline report.json --threshold 0.2
+    python benchmarks/regression.py --replay my_recording.jsonl --only http
+
+Compared against a baseline are the ``*_per_sec`` metrics (a drop of more
+than ``threshold`` fails) and the ``*_p99_ms`` metrics (a rise of more than
+``threshold`` fails); the exit code is 1 when any of them regressed.
+Record a request log from a running server with ``"record_requests":
+"recordings/session.jsonl"`` in the ``server`` section of mosys.json.
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_RECORDING = os.path.join(ROOT, 'benchmarks', 'recordings', 'pos_session.jsonl')
+PAPER_SIZES = ('58mm', '80mm')
+ITEM_COUNTS = (5, 50, 200)
+OUTPUTS = ('text', 'escpos')
+ROUNDS = 5  # Rounds per render benchmark, the fastest one counts
+
+# name: simulated printer settings
+HTTP_SCENARIOS = {
+    'http_replay': {'latency': 0, 'fail_rate': 0},
+    'http_replay_slow_printer': {'latency': 0.005, 'fail_rate': 0.02}
+}
+
+
+def render_scenarios():
+    return [f'render_{paper_size}_{item_count}_items_{output}'
+            for paper_size in PAPER_SIZES for item_count in ITEM_COUNTS for output in OUTPUTS]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def latency_summary(latencies):
+    return {'latency_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'latency_p99_ms': round(percentile(latencies, 99) * 1000, 3)}
+
+
+def setup_workdir(config):
+    """Fresh working directory with mosys.json, a 58mm default and an 80mm named template."""
+    workdir = tempfile.mkdtemp(prefix='mosys-bench-')
+    os.chdir(workdir)
+    with open('mosys.json', 'w') as f:
+        json.dump(config, f)
+    with open(os.path.join(ROOT, 'receipt_template.json')) as f:
+        template_58mm = json.load(f)
+    with open('receipt_template.json', 'w') as f:
+        json.dump(dict(template_58mm, paper_size='58mm'), f)
+    os.mkdir('templates')
+    from receipt_template import DEFAULT_TEMPLATE
+    with open(os.path.join('templates', '80mm.json'), 'w') as f:
+        json.dump(dict(DEFAULT_TEMPLATE, paper_size='80mm'), f)
+
+
+def run_render(name, args):
+    _, paper_size, item_count, _, output = name.split('_')
+    setup_workdir({})
+    from bench_render import make_receipt
+    from receipt_template import ReceiptTemplate
+
+    templates = ReceiptTemplate()
+    template = templates.get(None if paper_size == '58mm' else paper_size)
+    render = template.generate_receipt if output == 'text' else template.render_document
+    data = make_receipt(int(item_count))
+    for _ in range(20):
+        render(data)
+    latencies = []
+    best = 0
+    # Best of several rounds, like timeit, so a busy moment on the machine does not count as a regression
+    for _ in range(ROUNDS):
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.min_time / ROUNDS:
+            call_start = time.perf_counter()
+            render(data)
+            latencies.append(time.perf_counter() - call_start)
+            count += 1
+        best = max(best, count / (time.perf_counter() - start))
+    return dict({'receipts_per_sec': round(best, 1)}, **latency_summary(latencies))
+
+
+def load_recording(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def request_body(record):
+    if 'body_base64' in record:
+        return base64.b64decode(record['body_base64'])
+    return record.get('body', '').encode('utf-8')
+
+
+def replay_client(port, records, next_index, total, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while True:
+        index = next_index()
+        if index >= total:
+            break
+        record = records[index % len(records)]
+        headers = dict(record.get('headers', {}))
+        if 'Idempotency-Key' in headers:
+            # Every pass over the log is a new set of receipts
+            headers['Idempotency-Key'] += f'-{index // len(records)}'
+        path = record['path'] + ('?' + record['query'] if record.get('query') else '')
+        start = time.perf_counter()
+        try:
+            conn.request(record['method'], path, request_body(record), headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        results.append((status, time.perf_counter() - start))
+    conn.close()
+
+
+def run_http(name, args):
+    from printer_simulator import SimulatedPrinter
+
+    printer = SimulatedPrinter(seed=1, **HTTP_SCENARIOS[name]).start()
+    setup_workdir({'active_printer': 'sim', 'queue_max_depth': args.requests, 'idempotency_window': 0,
+                   'printers': {'sim': {'transport': 'tcp', 'host': '127.0.0.1', 'port': printer.port}}})
+    import receipt_template
+    from http_server import PrintServer
+
+    records = load_recording(args.replay)
+    print_queue = receipt_template.get_print_queue()
+    finished = {'done': 0, 'failed': 0}
+
+    def job_changed(job):
+        if job.status in finished:
+            finished[job.status] += 1
+
+    print_queue.add_listener(job_changed)
+    server = PrintServer(receipt_template.app, print_queue, host='127.0.0.1', port=0,
+                         threads=args.clients).start()
+
+    counter = iter(range(args.requests + args.clients))
+    counter_lock = threading.Lock()
+
+    def next_index():
+        with counter_lock:
+            return next(counter)
+
+    results = []
+    threads = [threading.Thread(target=replay_client, args=(server.port, records, next_index, args.requests, results))
+               for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.stop(timeout=120)
+    total_time = time.perf_counter() - start
+    printer.stop()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return dict({'requests_per_sec': round(len(results) / elapsed, 1)},
+                **latency_summary([latency for _, latency in results]),
+                jobs_per_sec=round((finished['done'] + finished['failed']) / total_time, 1),
+                jobs_done=finished['done'], jobs_failed=finished['failed'],
+                printer_failures=printer.failures, errors=errors, statuses=statuses)
+
+
+def run_child(name, args):
+    import logging
+    import receipt_template  # noqa: F401, sets up logging first
+    logging.getLogger().setLevel(logging.ERROR)
+    result = run_render(name, args) if name.startswith('render_') else run_http(name, args)
+    print(json.dumps(result))
+
+
+def run_scenario(name, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--min-time', str(args.min_time),
+               '--requests', str(args.requests), '--clients', str(args.clients),
+               '--replay', args.replay]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report, baseline, threshold, min_delta_ms=0.1):
+    """Return the metrics that got worse than ``baseline`` by more than ``threshold``.
+
+    Latencies must also grow by at least ``min_delta_ms``; the p99 of a
+    render that takes a few microseconds is mostly timer and scheduler noise.
+    """
+    regressions = []
+    for name, metrics in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name, {})
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if not isinstance(old, (int, float)) or not old:
+                continue
+            if metric.endswith('_per_sec') and value < old * (1 - threshold):
+                regressions.append((name, metric, old, value))
+            elif metric.endswith('_p99_ms') and value > old * (1 + threshold) and value - old >= min_delta_ms:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed relative regression before failing (default 0.2)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.1,
+                        help="latency increases smaller than this never fail (default 0.1)")
+    parser.add_argument('--only', help="run only scenarios whose name contains this text")
+    parser.add_argument('--replay', default=DEFAULT_RECORDING, help="recorded request log for the HTTP scenarios")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per HTTP scenario")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--min-time', type=float, default=1.0, help="seconds per render benchmark")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.replay = os.path.abspath(args.replay)
+
+    if args.child:
+        run_child(args.child, args)
+        return 0
+
+    names = [name for name in render_scenarios() + list(HTTP_SCENARIOS) if not args.only or args.only in name]
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'requests': args.requests, 'clients': args.clients, 'min_time': args.min_time,
+                     'replay': os.path.basename(args.replay), 'http_scenarios': HTTP_SCENARIOS},
+        'scenarios': {}
+    }
+    for name in names:
+        result = report['scenarios'][name] = run_scenario(name, args)
+        rate = result.get('receipts_per_sec', result.get('requests_per_sec'))
+        print(f"{name:<36} {rate:>10.1f}/s  p99 {result['latency_p99_ms']:>8.2f} ms"
+              + (f"  jobs {result['jobs_done']} done {result['jobs_failed']} failed  errors {result['errors']}"
+                 if 'jobs_done' in result else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old} -> {new}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
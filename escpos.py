@@ -0,0 +1,217 @@
+import unicodedata
+
+ESC = b"\x1B"
+GS = b"\x1D"
+
+INITIALIZE = ESC + b"\x40"
+CUT = GS + b"\x56\x41\x03"
+END_OF_RECEIPT = b"\x0A\x0D"
+
+ALIGNMENTS = {'left': 0, 'center': 1, 'right': 2}
+FONT_MODES = {'A': 0x00, 'B': 0x01}  # ESC ! font bit
+FONT_DOTS = {'A': 12, 'B': 9}  # Character cell width in dots of each font
+PAPER_DOTS = {'58mm': 384, '80mm': 576}  # Printable dots per line of each paper size
+MODE_BOLD = 0x08  # ESC ! emphasized bit
+MODE_DOUBLE_HEIGHT = 0x10
+
+
+class _TranslationTable(dict):
+    """str.translate table that maps the characters it does not list on first use.
+
+    Combining marks and invisible format characters are dropped and wide
+    (CJK) characters become ``??``, so they take as many columns on paper
+    as the receipt layout reserved for them; the rest become ``?``.
+    """
+
+    def __missing__(self, code):
+        char = chr(code)
+        if unicodedata.category(char) in ('Mn', 'Me', 'Cf'):
+            replacement = ''
+        elif unicodedata.east_asian_width(char) in ('W', 'F'):
+            replacement = '??'
+        else:
+            replacement = '?'
+        self[code] = replacement
+        return replacement
+
+
+class Codepage:
+    """A printer character table with a precomputed str.translate table.
+
+    Every character the codepage can print maps to its byte (as a latin-1
+    character); a few common typographic characters map to ASCII look-alikes
+    and anything else in the latin-1 range maps to '?'. Other characters are
+    mapped by ``_TranslationTable`` when they first show up.
+    """
+
+    FALLBACKS = {
+        '‘': "'", '’': "'", '“': '"', '”': '"',
+        '–': '-', '—': '-', '…': '...', '•': '*', '€': 'EUR'
+    }
+
+    def __init__(self, name, codec, table_number):
+        self.name = name
+        self.codec = codec
+        self.select = ESC + b"\x74" + bytes([table_number])
+        table = _TranslationTable((code, chr(code)) for code in range(0x80))
+        for code in range(0x80, 0x100):
+            table[code] = '?'
+        for fallback_char, replacement in self.FALLBACKS.items():
+            table[ord(fallback_char)] = replacement
+        for byte in range(0x80, 0x100):
+            char = bytes([byte]).decode(codec)
+            table[ord(char)] = chr(byte)
+        self.table = table
+
+    def encode(self, text):
+        if text.isascii():
+            return text.encode('ascii')
+        return text.translate(self.table).encode('latin-1', errors='replace')
+
+
+CODEPAGES = {
+    'cp437': Codepage('cp437', 'cp437', 0),
+    'pc850': Codepage('pc850', 'cp850', 2),
+    'cp858': Codepage('cp858', 'cp858', 19)
+}
+
+
+def get_codepage(name):
+    try:
+        return CODEPAGES[name.lower()]
+    except (KeyError, AttributeError):
+        raise ValueError(f"Unknown codepage '{name}' (supported: {', '.join(CODEPAGES)})")
+
+
+class TextStyle:
+    __slots__ = ('align', 'bold', 'double_height', 'key')
+
+    def __init__(self, align='left', bold=False, double_height=False):
+        if align not in ALIGNMENTS:
+            raise ValueError(f"Unknown alignment '{align}' (supported: {', '.join(ALIGNMENTS)})")
+        self.align = align
+        self.bold = bool(bold)
+        self.double_height = bool(double_height)
+        self.key = (self.align, self.bold, self.double_height)
+
+
+PLAIN = TextStyle()
+
+
+class EscPosDocument:
+    """ESC/POS command stream written into one preallocated, growable buffer.
+
+    Lines are separated with LF the same way ``'\\n'.join`` would; a style
+    change is written at the start of the line it applies to, which is where
+    printers honour ESC a.
+    """
+
+    def __init__(self, codepage='cp437', capacity=4096, font='A'):
+        self.codepage = get_codepage(codepage) if isinstance(codepage, str) else codepage
+        # ESC ! sets font, bold and double height at once, so all three go into every ESC ! written
+        self.font_mode = FONT_MODES[font]
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._pos = 0
+        self._line_open = False
+        self._style = PLAIN.key
+
+    def __len__(self):
+        return self._pos
+
+    def write(self, data):
+        end = self._pos + len(data)
+        if end > len(self._buf):
+            self._grow(end)
+        self._view[self._pos:end] = data
+        self._pos = end
+        return self
+
+    def _grow(self, needed):
+        new_buf = bytearray(max(needed, len(self._buf) * 2))
+        new_buf[:self._pos] = self._view[:self._pos]
+        self._view.release()
+        self._buf = new_buf
+        self._view = memoryview(new_buf)
+
+    def begin(self):
+        self.write(INITIALIZE)
+        self.write(self.codepage.select)
+        if self.font_mode:
+            self.write(self._select_mode(PLAIN.bold, PLAIN.double_height))
+        self._style = PLAIN.key
+        return self
+
+    def _select_mode(self, bold, double_height):
+        mode = self.font_mode | (MODE_BOLD if bold else 0) | (MODE_DOUBLE_HEIGHT if double_height else 0)
+        return ESC + b"\x21" + bytes([mode])
+
+    def set_style(self, style):
+        key = style.key
+        if key == self._style:
+            return self
+        align, bold, double_height = key
+        if align != self._style[0]:
+            self.write(ESC + b"\x61" + bytes([ALIGNMENTS[align]]))
+        if bold != self._style[1] or double_height != self._style[2]:
+            self.write(self._select_mode(bold, double_height))
+        self._style = key
+        return self
+
+    def line(self, text, style=PLAIN):
+        if style.key != self._style:
+            if self._line_open:
+                self.write(b"\n")
+                self._line_open = False
+            self.set_style(style)
+        data = text.encode('ascii') if text.isascii() else self.codepage.encode(text)
+        if self._line_open:
+            data = b"\n" + data
+        # Inlined write(), this runs once per receipt line
+        end = self._pos + len(data)
+        if end > len(self._buf):
+            self._grow(end)
+        self._view[self._pos:end] = data
+        self._pos = end
+        self._line_open = True
+        return self
+
+    def raw(self, data):
+        """Write pre-built command bytes (e.g. a raster image) as their own line."""
+        if self._line_open:
+            self.write(b"\n")
+            self._line_open = False
+        self.write(data)
+        return self
+
+    def end(self):
+        self.write(END_OF_RECEIPT)
+        self.write(CUT)
+        self._line_open = False
+        return self
+
+    def getvalue(self):
+        return bytes(self._view[:self._pos])
+
+    def take(self):
+        """Return the bytes written since the last ``take`` and empty the buffer, to stream a document in chunks."""
+        data = bytes(self._view[:self._pos])
+        self._pos = 0
+        return data
+
+
+class TextLines:
+    """Collects rendered lines as plain text, ignoring styles."""
+
+    def __init__(self):
+        self.lines = []
+
+    def line(self, text, style=PLAIN):
+        self.lines.append(text)
+        return self
+
+    def raw(self, data):
+        return self
+
+    def getvalue(self):
+        return '\n'.join(self.lines)
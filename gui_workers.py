@@ -0,0 +1,65 @@
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QTimer, pyqtSignal, pyqtSlot
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class Worker(QRunnable):
+    """Runs ``fn(*args, **kwargs)`` on a ``QThreadPool`` thread.
+
+    The result (or the error message) is reported through ``signals``;
+    since the signals object lives on the GUI thread, connected slots run
+    there and may touch widgets.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            logging.error(f"Background task {getattr(self.fn, '__name__', self.fn)} failed: {str(e)}")
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)
+
+
+class JobMonitor(QObject):
+    """Forwards print queue job changes to the GUI thread.
+
+    ``job_changed`` is registered with ``PrintQueue.add_listener`` and is
+    called from HTTP and print worker threads; changes are collected and
+    emitted as one ``jobsChanged`` batch every ``interval`` milliseconds, so
+    a busy queue does not flood the GUI with one update per state change.
+    """
+
+    jobsChanged = pyqtSignal(list)
+
+    def __init__(self, interval=250, parent=None):
+        super().__init__(parent)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(interval)
+
+    def job_changed(self, job):
+        with self._lock:
+            self._pending[job.id] = job
+
+    def flush(self):
+        with self._lock:
+            jobs, self._pending = list(self._pending.values()), {}
+        if jobs:
+            self.jobsChanged.emit(jobs)
@@ -0,0 +1,361 @@
+import base64
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+
+DEFAULT_SERVER_CONFIG = {
+    'host': '0.0.0.0',
+    'port': 1717,
+    'threads': 16,
+    'keepalive_timeout': 15,
+    'max_idle_connections': None,  # Kept-alive connections waiting for a request; half the threads by default
+    'max_request_bytes': 2 * 1024 * 1024,
+    'access_log': False,
+    'shutdown_timeout': 30,
+    'record_requests': None
+}
+
+DRAIN_LIMIT = 64 * 1024  # Unread request bodies up to this size are skipped to keep the connection open
+
+# Request headers kept in a recording; the rest depend on the client that sent them
+RECORDED_HEADERS = ('Content-Type', 'Accept', 'Idempotency-Key', 'If-None-Match')
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """HTTP/1.1 handler, so POS clients can reuse one connection for many requests.
+
+    Werkzeug 2.1 and later close the connection after every response, so
+    ``run_wsgi`` writes the response itself. The connection stays open when
+    the client did not ask to close it, its request body has been read to
+    the end and the server has an idle slot for it (``keep_alive``).
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle the body of a kept-alive
+    # response would wait for the client's delayed ACK of the headers
+    disable_nagle_algorithm = True
+    access_log = False
+
+    def log_request(self, *args, **kwargs):
+        if self.access_log:
+            super().log_request(*args, **kwargs)
+
+    def log_error(self, format, *args):
+        if format.startswith('Request timed out'):
+            # A kept-alive connection idle for keepalive_timeout seconds, nothing went wrong
+            logging.debug(f"Closing idle connection from {self.address_string()}")
+            return
+        super().log_error(format, *args)
+
+    def handle_one_request(self):
+        # While waiting for the next request on a kept-alive connection the
+        # connection is idle and may be closed by a shutdown
+        if not self.server.mark_idle(self.connection):
+            self.close_connection = True
+            return
+        super().handle_one_request()
+
+    def parse_request(self):
+        self.server.mark_busy(self.connection)
+        return super().parse_request()
+
+    def run_wsgi(self):
+        if self.headers.get('Expect', '').lower().strip(' \t') == '100-continue':
+            self.wfile.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        self.environ = environ = self.make_environ()
+        body = None
+        if not environ.get('wsgi.input_terminated'):
+            # Chunked bodies close the connection, others are read up to Content-Length at most
+            body = environ['wsgi.input'] = LimitedStream(self.rfile, int(environ.get('CONTENT_LENGTH') or 0))
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if 'sent' in response:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif 'status' in response:
+                raise AssertionError("Headers already set")
+            response['status'] = status
+            response['headers'] = headers
+            return write
+
+        def write(data):
+            if 'sent' not in response:
+                response['sent'] = True
+                self._send_headers(environ, response, body)
+            if data:
+                if response['chunked']:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                else:
+                    self.wfile.write(data)
+            self.wfile.flush()
+
+        def execute(app):
+            application_iter = app(environ, start_response)
+            try:
+                for data in application_iter:
+                    write(data)
+                if 'sent' not in response:
+                    write(b'')
+                if response['chunked']:
+                    self.wfile.write(b'0\r\n\r\n')
+                    self.wfile.flush()
+            finally:
+                if hasattr(application_iter, 'close'):
+                    application_iter.close()
+
+        try:
+            execute(self.server.app)
+            if not self.close_connection and not body.is_exhausted:
+                # A small body the app did not read, e.g. a 404; read it so the next request line follows
+                body.exhaust()
+        except (ConnectionError, socket.timeout):
+            self.close_connection = True
+        except Exception:
+            self.close_connection = True
+            logging.exception(f"Error on request {self.command} {self.path}")
+            if 'sent' not in response:
+                response.clear()
+                try:
+                    execute(InternalServerError())
+                except Exception:
+                    pass
+
+    def _send_headers(self, environ, response, body):
+        code, _, message = response['status'].partition(' ')
+        code = int(code)
+        self.send_response(code, message)
+        header_keys = set()
+        for key, value in response['headers']:
+            if key.lower() != 'connection':
+                self.send_header(key, value)
+                header_keys.add(key.lower())
+        # Without a length the body of an HTTP/1.0 response ends when the connection closes
+        unframed = ('content-length' not in header_keys and environ['REQUEST_METHOD'] != 'HEAD'
+                    and code >= 200 and code not in (204, 304))
+        response['chunked'] = unframed and self.request_version >= 'HTTP/1.1'
+        if response['chunked']:
+            self.send_header('Transfer-Encoding', 'chunked')
+        keep = (not self.close_connection and body is not None and (response['chunked'] or not unframed)
+                and (body.is_exhausted or body.limit <= DRAIN_LIMIT)
+                and self.server.keep_alive(self.connection))
+        # send_header sets close_connection from the Connection header
+        self.send_header('Connection', 'keep-alive' if keep else 'close')
+        self.end_headers()
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug WSGI server that handles connections on a fixed pool of worker threads.
+
+    Unlike the development server (one new thread per connection), the number
+    of threads is bounded; connections beyond the pool size wait in the
+    executor queue until a worker is free. A kept-alive connection holds its
+    worker while it waits for the next request, so at most ``max_idle``
+    (half the threads by default) are kept open, and none while other
+    connections wait for a worker.
+    """
+
+    multithread = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host, port, app, threads=16, handler=KeepAliveRequestHandler, max_idle=None):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http-worker')
+        self.max_idle = threads // 2 if max_idle is None else min(max_idle, threads - 1)
+        self.stopping = False
+        self._idle = set()
+        self._kept = set()
+        self._waiting = 0
+        self._idle_lock = threading.Lock()
+        super().__init__(host, port, app, handler=handler)
+
+    def mark_idle(self, connection):
+        with self._idle_lock:
+            if self.stopping:
+                return False
+            self._idle.add(connection)
+            return True
+
+    def mark_busy(self, connection):
+        with self._idle_lock:
+            self._idle.discard(connection)
+            self._kept.discard(connection)
+
+    def keep_alive(self, connection):
+        """Whether ``connection`` may stay open after its response; it then counts as kept until its next request."""
+        with self._idle_lock:
+            if self.stopping or self._waiting or len(self._kept) >= self.max_idle:
+                return False
+            self._kept.add(connection)
+            return True
+
+    def close_idle_connections(self):
+        """Stop taking new requests and wake up connections waiting for their next request."""
+        with self._idle_lock:
+            self.stopping = True
+            idle, self._idle = self._idle, set()
+        for connection in idle:
+            try:
+                connection.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+
+    def process_request(self, request, client_address):
+        with self._idle_lock:
+            self._waiting += 1
+        self.executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        with self._idle_lock:
+            self._waiting -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.mark_busy(request)
+            self.shutdown_request(request)
+
+
+class RequestRecorder:
+    """WSGI middleware appending every request to a JSON-lines file for later replay.
+
+    Each line holds the offset in seconds since the first request, method,
+    path, query string, the headers in ``RECORDED_HEADERS`` and the body
+    (base64 when it is not UTF-8). ``benchmarks/regression.py --replay``
+    plays such a file back against the server. Chunked bodies (no
+    Content-Length) longer than ``max_bytes``, the request size limit, are
+    passed on without being recorded.
+    """
+
+    def __init__(self, app, path, max_bytes=None):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._started = None
+
+    def __call__(self, environ, start_response):
+        if environ.get('wsgi.input_terminated'):
+            # Chunked body without Content-Length, read up to the end (one byte past the limit at most)
+            body = environ['wsgi.input'].read(self.max_bytes + 1 if self.max_bytes else -1)
+        else:
+            body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+        environ['wsgi.input'] = BytesIO(body)
+        if self.max_bytes and len(body) > self.max_bytes:
+            return self.app(environ, start_response)
+        now = time.monotonic()
+        headers = {}
+        for name in RECORDED_HEADERS:
+            key = 'CONTENT_TYPE' if name == 'Content-Type' else 'HTTP_' + name.upper().replace('-', '_')
+            if environ.get(key):
+                headers[name] = environ[key]
+        record = {'method': environ['REQUEST_METHOD'], 'path': environ.get('PATH_INFO', '/'),
+                  'query': environ.get('QUERY_STRING', ''), 'headers': headers}
+        try:
+            record['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            record['body_base64'] = base64.b64encode(body).decode('ascii')
+        with self._lock:
+            if self._started is None:
+                self._started = now
+            record = dict(t=round(now - self._started, 4), **record)
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+        return self.app(environ, start_response)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrintServer:
+    """Production HTTP server for the Flask app with graceful shutdown.
+
+    ``stop()`` stops accepting connections, lets in-flight requests finish,
+    then drains the print queue so accepted jobs still reach the printer.
+    A ``channel`` (``SubmissionChannel``) is started and stopped with it.
+    With ``record_requests`` set to a file name, requests are recorded
+    there by ``RequestRecorder``.
+    """
+
+    def __init__(self, app, print_queue=None, channel=None, **config):
+        self.app = app
+        self.print_queue = print_queue
+        self.channel = channel
+        self.config = dict(DEFAULT_SERVER_CONFIG, **{k: v for k, v in config.items() if v is not None})
+        self._server = None
+        self._thread = None
+        self._recorder = None
+
+    @property
+    def port(self):
+        return self._server.server_port if self._server else self.config['port']
+
+    def start(self):
+        config = self.config
+        self.app.config['MAX_CONTENT_LENGTH'] = config['max_request_bytes']
+        handler = type('RequestHandler', (KeepAliveRequestHandler,), {
+            'timeout': config['keepalive_timeout'],
+            'access_log': config['access_log']
+        })
+        app = self.app
+        if config['record_requests']:
+            app = self._recorder = RequestRecorder(app, config['record_requests'], config['max_request_bytes'])
+            logging.info(f"Recording requests to {config['record_requests']}")
+        self._server = PooledWSGIServer(config['host'], config['port'], app, threads=config['threads'],
+                                        handler=handler, max_idle=config['max_idle_connections'])
+        self._thread = threading.Thread(target=self._server.serve_forever, name='http-server', daemon=True)
+        self._thread.start()
+        logging.info(f"Print server listening on {config['host']}:{self.port} "
+                     f"({config['threads']} worker threads)")
+        if self.channel is not None:
+            self.channel.start()
+        return self
+
+    def serve_forever(self):
+        """Start and block until ``stop()`` is called from another thread or a signal handler."""
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self, timeout=None):
+        if self._server is None:
+            return True
+        timeout = self.config['shutdown_timeout'] if timeout is None else timeout
+        logging.info("Stopping print server")
+        self._server.shutdown()
+        self._server.server_close()
+        if self.channel is not None:
+            self.channel.stop()
+        # In-flight requests finish, idle keep-alive connections are closed
+        self._server.close_idle_connections()
+        self._server.executor.shutdown(wait=True)
+        self._server = None
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+        drained = True
+        if self.print_queue is not None:
+            drained = self.print_queue.drain(timeout)
+            if not drained:
+                logging.warning("Print queue did not drain before shutdown timeout")
+        return drained
@@ -0,0 +1,217 @@
+import base64
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+
+FINAL_STATUSES = ('done', 'failed')
+
+
+class JobJournal:
+    """Append-only journal of print jobs, used to replay unfinished jobs after a crash.
+
+    Records are appended to ``journal-NNNNNN.jsonl`` segments in ``directory``.
+    ``append`` only queues the record in memory; a writer thread serializes
+    queued records, writes them in one batch and fsyncs once per batch, so
+    the cost on the request path stays small and fixed. When the current
+    segment grows past ``segment_size`` bytes a new one is started and the
+    closed segments are compacted down to the jobs that are still unfinished.
+    A restart keeps appending to the last segment until it is full.
+    """
+
+    def __init__(self, directory='print_journal', segment_size=1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._queued_seq = 0
+        self._synced_seq = 0
+        self._stopping = False
+        self._compact_requested = False
+        self._segment_no = self._reuse_segments()
+        self._file = self._open_segment()
+        self._writer = threading.Thread(target=self._write_loop, name="job-journal-writer", daemon=True)
+        self._writer.start()
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'journal-*.jsonl')))
+
+    @staticmethod
+    def _segment_number(path):
+        return int(os.path.basename(path)[len('journal-'):-len('.jsonl')])
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'journal-{number:06d}.jsonl')
+
+    def _open_segment(self):
+        return open(self._segment_path(self._segment_no), 'ab')
+
+    def _reuse_segments(self):
+        """Pick the segment to append to at startup, so a restart does not add a segment every time.
+
+        The last segment is reused while it is under ``segment_size``; empty
+        closed segments are removed.
+        """
+        segments = self._segments()
+        for path in segments[:-1]:
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+        if not segments:
+            return 1
+        last = segments[-1]
+        size = os.path.getsize(last)
+        if size >= self.segment_size:
+            return self._segment_number(last) + 1
+        if size:
+            with open(last, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # End a line torn by a crash, so it is skipped instead of corrupting the next record
+                    f.write(b'\n')
+        return self._segment_number(last)
+
+    def append(self, record):
+        with self._cond:
+            self._buffer.append(record)
+            self._queued_seq += 1
+            self._cond.notify_all()
+            return self._queued_seq
+
+    def record_accepted(self, job_id, printer, text, meta=None):
+        return self.append({'op': 'accepted', 'job_id': job_id, 'printer': printer,
+                            'text': text, 'meta': meta or {}})
+
+    def record_moved(self, job_id, printer):
+        """A queued job was moved to another printer (failover); it is replayed there."""
+        return self.append({'op': 'moved', 'job_id': job_id, 'printer': printer})
+
+    def record_status(self, job_id, status, message=None):
+        return self.append({'op': 'status', 'job_id': job_id, 'status': status, 'message': message})
+
+    def flush(self, timeout=None):
+        """Wait until everything appended so far is written and fsynced."""
+        with self._cond:
+            target = self._queued_seq
+            return self._cond.wait_for(lambda: self._synced_seq >= target, timeout)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._stopping or self._compact_requested)
+                batch, self._buffer = self._buffer, []
+                seq = self._queued_seq
+                stopping = self._stopping
+                rotate, self._compact_requested = self._compact_requested, False
+            if batch:
+                try:
+                    self._file.write(b''.join(self._encode(record) for record in batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as e:
+                    logging.error(f"Error writing print job journal: {str(e)}")
+            if rotate or self._file.tell() >= self.segment_size:
+                self._rotate()
+            with self._cond:
+                self._synced_seq = seq
+                self._cond.notify_all()
+            if stopping and not batch:
+                break
+
+    @staticmethod
+    def _encode(record):
+        text = record.get('text')
+        if isinstance(text, dict):
+            # Receipt data rendered while printing (see PrintQueue), journaled as JSON
+            digest = hashlib.sha256(json.dumps(text, sort_keys=True).encode('utf-8'))
+            record = dict(record, sha256=digest.hexdigest())
+        elif text is not None:
+            texts = text if isinstance(text, list) else [text]
+            digest = hashlib.sha256()
+            for part in texts:
+                digest.update(part.encode('utf-8', errors='replace') if isinstance(part, str) else part)
+            record = dict(record, sha256=digest.hexdigest())
+            if isinstance(text, bytes):
+                record['text'] = base64.b64encode(text).decode('ascii')
+                record['encoding'] = 'base64'
+        return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def _rotate(self):
+        self._file.close()
+        self._segment_no += 1
+        self._file = self._open_segment()
+        try:
+            self._compact()
+        except OSError as e:
+            logging.error(f"Error compacting print job journal: {str(e)}")
+
+    def _compact(self):
+        """Rewrite the closed segments as one segment holding only unfinished jobs."""
+        current = self._segment_path(self._segment_no)
+        closed = [path for path in self._segments() if path != current]
+        if not closed:
+            return
+        pending = self._pending_records(closed)
+        if not pending:
+            for path in closed:
+                os.remove(path)
+            return
+        target = closed[-1]
+        tmp_path = target + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for record in pending:
+                f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+        for path in closed[:-1]:
+            os.remove(path)
+
+    @staticmethod
+    def _read_records(paths):
+        for path in paths:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        logging.warning(f"Skipping corrupt record in {path}")
+
+    def _pending_records(self, paths):
+        pending = {}
+        for record in self._read_records(paths):
+            if record.get('op') == 'accepted':
+                pending[record['job_id']] = record
+            elif record.get('op') == 'moved' and record['job_id'] in pending:
+                pending[record['job_id']]['printer'] = record['printer']
+            elif record.get('op') == 'status' and record.get('status') in FINAL_STATUSES:
+                pending.pop(record['job_id'], None)
+        return list(pending.values())
+
+    def unfinished_jobs(self):
+        """Accepted jobs without a final status, oldest first."""
+        with self._cond:
+            paths = self._segments()
+        records = self._pending_records(paths)
+        for record in records:
+            if record.pop('encoding', None) == 'base64':
+                record['text'] = base64.b64decode(record['text'])
+        return records
+
+    def compact(self):
+        """Start a new segment and compact everything before it."""
+        with self._cond:
+            self._compact_requested = True
+            self._queued_seq += 1
+            self._cond.notify_all()
+        self.flush()
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
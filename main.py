@@ -1,32 +1,75 @@
 import sys
 import json
+from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QComboBox, QTabWidget, QLineEdit, 
-                             QTextEdit, QFormLayout, QSpinBox, QMessageBox, QTextBrowser)
-from PyQt5.QtCore import Qt
-from receipt_template import ReceiptTemplate, PrinterManager
+                             QTextEdit, QFormLayout, QSpinBox, QMessageBox, QTextBrowser,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QCheckBox)
+from PyQt5.QtCore import Qt, QTimer, QThreadPool
+from PyQt5.QtGui import QFontDatabase
+from receipt_template import (get_receipt_template, get_printer_manager, get_print_queue, TemplateError, DEFAULT_TEMPLATE,
+                              StreamedReceipt)
+from escpos import PAPER_DOTS
+from metrics import metrics
+from gui_workers import Worker, JobMonitor
+
+JOB_COLUMNS = ["Job ID", "Printer", "Status", "Code", "Queued At", "Wait (ms)", "Print (ms)", "Message"]
+MAX_JOB_ROWS = 500
+PREVIEW_DELAY = 300  # Milliseconds without edits before the template preview is rendered again
+
+SAMPLE_RECEIPT = {
+    'nama_toko': 'Toko ABC',
+    'alamat_toko': 'Jl. Contoh No. 123',
+    'no_hp': '08123456789',
+    'nama_kasir': 'John Doe',
+    'code': '12121211',
+    'tanggal': '2024-09-02 15:30:00',
+    'items': [
+        {
+            'nama_produk': 'Produk A',
+            'qty': 2,
+            'satuan': 'pcs',
+            'harga': 10000,
+            'diskon': 1000,
+            'total_harga': 19000
+        },
+        {
+            'nama_produk': 'Produk B',
+            'qty': 1,
+            'satuan': 'pcs',
+            'harga': 15000,
+            'diskon': 0,
+            'total_harga': 15000
+        }
+    ],
+    'notes': 'Terima kasih telah berbelanja!'
+}
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.receipt_template = ReceiptTemplate()
-        self.printer_manager = PrinterManager()
-        self.load_config()
+        # Shared with the HTTP server, so the config and template are only loaded once
+        self.receipt_template = get_receipt_template()
+        self.printer_manager = get_printer_manager()
+        self.active_printer = self.printer_manager.active_printer
+        # Printer I/O runs on these threads, so a slow spooler never freezes the window
+        self.thread_pool = QThreadPool(self)
+        self.workers = set()
         self.initUI()
 
-    def load_config(self):
-        try:
-            with open('mosys.json', 'r') as f:
-                config = json.load(f)
-                self.active_printer = config.get('active_printer')
-                if self.active_printer:
-                    self.printer_manager.set_printer(self.active_printer)
-        except FileNotFoundError:
-            self.active_printer = None
-            print("mosys.json not found")
-        except json.JSONDecodeError:
-            self.active_printer = None
-            print("Invalid JSON in mosys.json")
+    def runInBackground(self, fn, *args, on_finished=None, on_failed=None):
+        """Run ``fn(*args)`` on the thread pool; the callbacks run on the GUI thread."""
+        worker = Worker(fn, *args)
+        # Keep a reference until the signals have been delivered
+        self.workers.add(worker)
+        worker.signals.finished.connect(lambda result: self.workers.discard(worker))
+        worker.signals.failed.connect(lambda error: self.workers.discard(worker))
+        if on_finished:
+            worker.signals.finished.connect(on_finished)
+        if on_failed:
+            worker.signals.failed.connect(on_failed)
+        self.thread_pool.start(worker)
+        return worker
 
     def initUI(self):
         self.setWindowTitle('Mosys Printer')
@@ -44,6 +87,8 @@ class MainWindow(QMainWindow):
         tabs.addTab(self.createPrinterTab(), "Printer Settings")
         tabs.addTab(self.createTemplateTab(), "Template Designer")
         tabs.addTab(self.createTestPrintTab(), "Test Print")
+        tabs.addTab(self.createJobsTab(), "Jobs")
+        tabs.addTab(self.createMetricsTab(), "Metrics")
 
         layout.addWidget(tabs)
 
@@ -59,13 +104,23 @@ class MainWindow(QMainWindow):
         <p>The server is running at: <a href="http://localhost:1717">http://localhost:1717</a></p>
         <h3>Available Endpoints:</h3>
         <ul>
-            <li><strong>GET /printers</strong>: Get a list of available printers</li>
+            <li><strong>GET /health</strong>: Check that the server is running</li>
+            <li><strong>GET /printers</strong>: Get a list of available printers (<code>?health=1</code> for health and queue depth)</li>
+            <li><strong>GET /printers/&lt;name&gt;/status</strong>: Paper, cover and online status reported by a printer</li>
             <li><strong>POST /set_printer</strong>: Set the active printer</li>
-            <li><strong>POST /print</strong>: Print a receipt</li>
-            <li><strong>POST /update_template</strong>: Update the receipt template</li>
+            <li><strong>POST /print</strong>: Queue a receipt for printing (returns a job ID)</li>
+            <li><strong>POST /print/batch</strong>: Print many receipts as one print job</li>
+            <li><strong>POST /reprint/&lt;code&gt;</strong>: Reprint a cached receipt by its code</li>
+            <li><strong>GET /jobs</strong>: List recent print jobs</li>
+            <li><strong>GET /jobs/&lt;id&gt;</strong>: Get the status of a print job</li>
+            <li><strong>GET /templates</strong>: List the named receipt templates</li>
+            <li><strong>GET /templates/&lt;name&gt;</strong>: Get one receipt template</li>
+            <li><strong>POST /update_template</strong>: Update (or create) a receipt template</li>
+            <li><strong>POST /preview</strong>: Render a receipt as text or PNG (<code>?format=png</code>) without printing it</li>
+            <li><strong>GET /metrics</strong>: Stage latencies and printer counters (Prometheus format)</li>
         </ul>
         <h3>How to use /print endpoint:</h3>
-        <p>Send a POST request to <code>http://localhost:1717/print</code> with the following form-data:</p>
+        <p>Send a POST request to <code>http://localhost:1717/print</code> with the following form-data (or the same fields as a JSON body, with <code>items</code> as an array):</p>
         <ul>
             <li><code>nama_toko</code>: Store name (string)</li>
             <li><code>alamat_toko</code>: Store address (string)</li>
@@ -75,6 +130,8 @@ class MainWindow(QMainWindow):
             <li><code>tanggal</code>: Transaction date and time (string, format: "YYYY-MM-DD HH:MM:SS")</li>
             <li><code>items</code>: List of purchased items (JSON string array)</li>
             <li><code>notes</code>: Additional notes (string, optional)</li>
+            <li><code>printer</code> / <code>station</code>: Printer, printer pool or station to print on (string, optional)</li>
+            <li><code>template</code>: Name of the receipt template (string, optional, default <code>default</code>)</li>
         </ul>
         <p>Example of <code>items</code> structure:</p>
         <pre>
@@ -124,7 +181,7 @@ class MainWindow(QMainWindow):
 
         # Refresh printer list button
         refresh_btn = QPushButton("Refresh Printer List")
-        refresh_btn.clicked.connect(self.updatePrinterList)
+        refresh_btn.clicked.connect(self.refreshPrinterList)
         layout.addWidget(refresh_btn)
 
         widget.setLayout(layout)
@@ -134,44 +191,104 @@ class MainWindow(QMainWindow):
         widget = QWidget()
         layout = QVBoxLayout()
 
+        editor_layout = QHBoxLayout()
         form_layout = QFormLayout()
 
+        # Named templates; typing a new name and saving creates a new template
+        self.template_name = QComboBox()
+        self.template_name.setEditable(True)
+        self.template_name.addItems(self.receipt_template.names())
+        self.template_name.setCurrentText('default')
+        self.template_name.activated[str].connect(self.loadTemplate)
+        form_layout.addRow("Template:", self.template_name)
+
         self.paper_size = QComboBox()
-        self.paper_size.addItems(['58mm', '80mm'])
-        self.paper_size.setCurrentText(self.receipt_template.template['paper_size'])
+        # Sizes from paper_dots in mosys.json can be picked too
+        self.paper_size.addItems(list(dict.fromkeys([*PAPER_DOTS, *self.receipt_template.paper_dots])))
         form_layout.addRow("Paper Size:", self.paper_size)
 
         self.font_size = QSpinBox()
         self.font_size.setRange(8, 24)
-        self.font_size.setValue(self.receipt_template.template['font_size'])
         form_layout.addRow("Font Size:", self.font_size)
 
+        # Printer font; with the paper size it sets the characters per line
+        self.printer_font = QComboBox()
+        self.printer_font.addItems(['A', 'B'])
+        form_layout.addRow("Printer Font:", self.printer_font)
+
+        self.codepage = QComboBox()
+        self.codepage.addItems(['cp437', 'cp858', 'pc850'])
+        form_layout.addRow("Printer Codepage:", self.codepage)
+
         self.header_format = QTextEdit()
-        self.header_format.setPlainText(self.receipt_template.template['header_format'])
         form_layout.addRow("Header Format:", self.header_format)
 
-        self.cashier_format = QLineEdit(self.receipt_template.template['cashier_format'])
+        self.cashier_format = QLineEdit()
         form_layout.addRow("Cashier Format:", self.cashier_format)
 
-        self.code_format = QLineEdit(self.receipt_template.template['code_format'])
+        self.code_format = QLineEdit()
         form_layout.addRow("Code Format:", self.code_format)
 
-        self.date_format = QLineEdit(self.receipt_template.template['date_format'])
+        self.date_format = QLineEdit()
         form_layout.addRow("Date Format:", self.date_format)
 
         self.item_format = QTextEdit()
-        self.item_format.setPlainText(self.receipt_template.template['item_format'])
         form_layout.addRow("Item Format:", self.item_format)
 
+        self.item_columns = QTextEdit()
+        self.item_columns.setPlaceholderText("Item columns as JSON (optional, used instead of Item Format)")
+        form_layout.addRow("Item Columns:", self.item_columns)
+
+        self.item_fields = QLineEdit()
+        self.item_fields.setPlaceholderText("Custom item fields used above, comma separated (optional)")
+        form_layout.addRow("Custom Item Fields:", self.item_fields)
+
         self.summary_format = QTextEdit()
-        self.summary_format.setPlainText(self.receipt_template.template['summary_format'])
         form_layout.addRow("Summary Format:", self.summary_format)
 
         self.footer_format = QTextEdit()
-        self.footer_format.setPlainText(self.receipt_template.template['footer_format'])
         form_layout.addRow("Footer Format:", self.footer_format)
 
-        layout.addLayout(form_layout)
+        self.header_image = QLineEdit()
+        self.header_image.setPlaceholderText("Path to logo image (optional)")
+        form_layout.addRow("Header Image:", self.header_image)
+
+        self.footer_image = QLineEdit()
+        self.footer_image.setPlaceholderText("Path to image (optional)")
+        form_layout.addRow("Footer Image:", self.footer_image)
+
+        # Live preview of the unsaved fields with sample data, rendered once typing pauses
+        preview_layout = QVBoxLayout()
+        preview_layout.addWidget(QLabel("Preview:"))
+        self.template_preview = QTextEdit()
+        self.template_preview.setReadOnly(True)
+        self.template_preview.setLineWrapMode(QTextEdit.NoWrap)
+        self.template_preview.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        preview_layout.addWidget(self.template_preview)
+        self.preview_error = QLabel()
+        self.preview_error.setWordWrap(True)
+        self.preview_error.setStyleSheet("color: red")
+        preview_layout.addWidget(self.preview_error)
+
+        self.preview_template = None
+        self.preview_settings = None
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DELAY)
+        self.preview_timer.timeout.connect(self.updatePreview)
+        for field in (self.paper_size, self.printer_font, self.codepage):
+            field.currentTextChanged.connect(self.preview_timer.start)
+        for field in (self.header_format, self.cashier_format, self.code_format, self.date_format,
+                      self.item_format, self.item_columns, self.item_fields, self.summary_format,
+                      self.footer_format):
+            field.textChanged.connect(self.preview_timer.start)
+
+        self.loadTemplate('default')
+        self.updatePreview()
+
+        editor_layout.addLayout(form_layout, 3)
+        editor_layout.addLayout(preview_layout, 2)
+        layout.addLayout(editor_layout)
 
         button_layout = QHBoxLayout()
         save_btn = QPushButton("Save Template")
@@ -187,6 +304,29 @@ class MainWindow(QMainWindow):
         widget.setLayout(layout)
         return widget
 
+    def loadTemplate(self, name):
+        try:
+            template = self.receipt_template.get(name).template
+        except TemplateError:
+            # A new name typed into the combo: keep the fields, saving creates the template
+            return
+        self.paper_size.setCurrentText(template['paper_size'])
+        self.font_size.setValue(template['font_size'])
+        self.printer_font.setCurrentText(template.get('font', 'A'))
+        self.codepage.setCurrentText(template.get('codepage', 'cp437'))
+        self.header_format.setPlainText(template['header_format'])
+        self.cashier_format.setText(template['cashier_format'])
+        self.code_format.setText(template['code_format'])
+        self.date_format.setText(template['date_format'])
+        self.item_format.setPlainText(template['item_format'])
+        item_columns = template.get('item_columns')
+        self.item_columns.setPlainText(json.dumps(item_columns, indent=2) if item_columns else '')
+        self.item_fields.setText(', '.join(template.get('item_fields') or []))
+        self.summary_format.setPlainText(template['summary_format'])
+        self.footer_format.setPlainText(template['footer_format'])
+        self.header_image.setText(template.get('header_image') or '')
+        self.footer_image.setText(template.get('footer_image') or '')
+
     def createTestPrintTab(self):
         widget = QWidget()
         layout = QVBoxLayout()
@@ -203,20 +343,167 @@ class MainWindow(QMainWindow):
         widget.setLayout(layout)
         return widget
 
-    def updatePrinterList(self):
+    def createJobsTab(self):
+        widget = QWidget()
+        layout = QVBoxLayout()
+
+        self.jobs_summary = QLabel("Loading print queue...")
+        layout.addWidget(self.jobs_summary)
+
+        self.failed_only = QCheckBox("Show failed jobs only")
+        self.failed_only.toggled.connect(self.filterJobs)
+        layout.addWidget(self.failed_only)
+
+        self.jobs_table = QTableWidget(0, len(JOB_COLUMNS))
+        self.jobs_table.setHorizontalHeaderLabels(JOB_COLUMNS)
+        self.jobs_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.jobs_table.horizontalHeader().setStretchLastSection(True)
+        self.jobs_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.jobs_table)
+        self.job_rows = {}
+        self.test_jobs = {}  # Job id -> success message of the test prints still in the queue
+
+        # Job changes arrive from the HTTP and print worker threads and are applied here in batches
+        self.job_monitor = JobMonitor(parent=self)
+        self.job_monitor.jobsChanged.connect(self.updateJobs)
+        # Creating the print queue may replay the journal, so it is not done on the GUI thread
+        self.runInBackground(get_print_queue, on_finished=self.watchPrintQueue,
+                             on_failed=lambda error: self.jobs_summary.setText(f"Print queue unavailable: {error}"))
+
+        widget.setLayout(layout)
+        return widget
+
+    def watchPrintQueue(self, print_queue):
+        self.print_queue = print_queue
+        print_queue.add_listener(self.job_monitor.job_changed)
+        self.updateJobs(print_queue.list_jobs())
+
+    def updateJobs(self, jobs):
+        table = self.jobs_table
+        for job in jobs:
+            row = self.job_rows.get(job.id)
+            if row is None:
+                row = table.rowCount()
+                table.insertRow(row)
+                self.job_rows[job.id] = row
+            wait = (job.started_at - job.created_at) * 1000 if job.started_at else None
+            duration = (job.finished_at - job.started_at) * 1000 if job.finished_at and job.started_at else None
+            values = [
+                job.id[:12], job.printer, job.status, job.meta.get('code') or '',
+                datetime.fromtimestamp(job.created_at).strftime('%H:%M:%S'),
+                f"{wait:.0f}" if wait is not None else '',
+                f"{duration:.0f}" if duration is not None else '',
+                job.message or ''
+            ]
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+            table.setRowHidden(row, self.failed_only.isChecked() and job.status != 'failed')
+            if job.finished.is_set() and job.id in self.test_jobs:
+                self.showPrintResult(job, self.test_jobs.pop(job.id))
+
+        if table.rowCount() > MAX_JOB_ROWS:
+            # Drop the oldest rows in one go and renumber the rest
+            excess = table.rowCount() - MAX_JOB_ROWS + MAX_JOB_ROWS // 5
+            for _ in range(excess):
+                table.removeRow(0)
+            self.job_rows = {job_id: row - excess for job_id, row in self.job_rows.items() if row >= excess}
+        self.updateJobsSummary()
+
+    def updateJobsSummary(self):
+        counts = {}
+        for row in range(self.jobs_table.rowCount()):
+            status = self.jobs_table.item(row, 2).text()
+            counts[status] = counts.get(status, 0) + 1
+        depths = self.print_queue.depth()
+        queued = ', '.join(f"{printer}: {depth}" for printer, depth in sorted(depths.items())) or 'empty'
+        self.jobs_summary.setText(
+            f"Queued: {counts.get('queued', 0)}  Held: {counts.get('held', 0)}  Printing: {counts.get('printing', 0)}  "
+            f"Done: {counts.get('done', 0)}  Failed: {counts.get('failed', 0)}  |  Queue depth: {queued}")
+
+    def filterJobs(self, failed_only):
+        for row in range(self.jobs_table.rowCount()):
+            status = self.jobs_table.item(row, 2).text()
+            self.jobs_table.setRowHidden(row, failed_only and status != 'failed')
+
+    def createMetricsTab(self):
+        widget = QWidget()
+        layout = QVBoxLayout()
+
+        layout.addWidget(QLabel("Stage latency:"))
+        self.stage_table = QTableWidget(0, 6)
+        self.stage_table.setHorizontalHeaderLabels(["Stage", "Printer", "Count", "Avg (ms)", "p50 (ms)", "p99 (ms)"])
+        self.stage_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.stage_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.stage_table)
+
+        layout.addWidget(QLabel("Printers:"))
+        self.printer_table = QTableWidget(0, 5)
+        self.printer_table.setHorizontalHeaderLabels(["Printer", "Jobs", "Errors", "Bytes", "Queue Depth"])
+        self.printer_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.printer_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.printer_table)
+
+        # Percentiles are bucket upper bounds, so they are estimates
+        layout.addWidget(QLabel("p50/p99 are upper bounds of the histogram bucket."))
+
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.updateMetrics)
+        self.metrics_timer.start(1000)
+
+        widget.setLayout(layout)
+        return widget
+
+    def updateMetrics(self):
+        if not self.stage_table.isVisible():
+            return
+        summary = metrics.summary()
+        self.fillTable(self.stage_table, [
+            [row['stage'], row['printer'], row['count'], f"{row['avg_ms']:.2f}",
+             f"{row['p50_ms']:g}", f"{row['p99_ms']:g}"]
+            for row in summary['stages']
+        ])
+        self.fillTable(self.printer_table, [
+            [printer, row['jobs'], row['errors'], row['bytes'], row['queue_depth']]
+            for printer, row in sorted(summary['printers'].items())
+        ])
+
+    def fillTable(self, table, rows):
+        table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for column, value in enumerate(row):
+                table.setItem(row_index, column, QTableWidgetItem(str(value)))
+
+    def updatePrinterList(self, refresh=False):
+        self.printer_combo.setEnabled(False)
+        load = self.printer_manager.refresh_printers if refresh else self.printer_manager.get_printers
+        self.runInBackground(load, on_finished=self.showPrinterList, on_failed=self.showPrinterListError)
+
+    def showPrinterList(self, printers):
         self.printer_combo.clear()
-        printers = self.printer_manager.get_printers()
         self.printer_combo.addItems(printers)
-        
+        self.printer_combo.setEnabled(True)
+
         # Set the active printer in the combo box
         if self.active_printer and self.active_printer in printers:
             index = self.printer_combo.findText(self.active_printer)
             if index >= 0:
                 self.printer_combo.setCurrentIndex(index)
 
+    def showPrinterListError(self, error):
+        self.printer_combo.setEnabled(True)
+        QMessageBox.warning(self, "Error", f"Failed to load printers: {error}")
+
+    def refreshPrinterList(self):
+        self.updatePrinterList(refresh=True)
+
     def setPrinter(self):
         printer_name = self.printer_combo.currentText()
-        if self.printer_manager.set_printer(printer_name):
+        self.runInBackground(self.printer_manager.set_printer, printer_name,
+                             on_finished=lambda ok: self.printerSet(printer_name, ok),
+                             on_failed=lambda error: QMessageBox.warning(self, "Error", f"Failed to set printer: {error}"))
+
+    def printerSet(self, printer_name, ok):
+        if ok:
             self.active_printer = printer_name
             self.active_printer_label.setText(f"Active Printer: {self.active_printer}")
             self.updateConfig()
@@ -225,79 +512,123 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Failed to set printer")
 
     def updateConfig(self):
-        config = {"active_printer": self.active_printer}
+        try:
+            with open('mosys.json', 'r') as f:
+                config = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            config = {}
+        config["active_printer"] = self.active_printer
         with open('mosys.json', 'w') as f:
             json.dump(config, f)
 
-    def saveTemplate(self):
-        new_template = {
+    def templateFields(self):
+        """The template settings in the form; raises TemplateError if Item Columns is not valid JSON."""
+        item_columns = self.item_columns.toPlainText().strip()
+        try:
+            item_columns = json.loads(item_columns) if item_columns else None
+        except ValueError as e:
+            raise TemplateError(f"item_columns: invalid JSON: {str(e)}")
+        return {
             'paper_size': self.paper_size.currentText(),
             'font_size': self.font_size.value(),
+            'font': self.printer_font.currentText(),
+            'codepage': self.codepage.currentText(),
             'header_format': self.header_format.toPlainText(),
             'cashier_format': self.cashier_format.text(),
             'code_format': self.code_format.text(),
             'date_format': self.date_format.text(),
             'item_format': self.item_format.toPlainText(),
+            'item_columns': item_columns,
+            'item_fields': [name.strip() for name in self.item_fields.text().split(',') if name.strip()],
             'summary_format': self.summary_format.toPlainText(),
-            'footer_format': self.footer_format.toPlainText()
+            'footer_format': self.footer_format.toPlainText(),
+            'header_image': self.header_image.text().strip() or None,
+            'footer_image': self.footer_image.text().strip() or None
         }
-        self.receipt_template.update_template(**new_template)
-        QMessageBox.information(self, "Template Saved", "Receipt template has been updated and saved")
 
-    def testTemplate(self):
-        self.saveTemplate()
-
-        test_data = {
-            'nama_toko': 'Toko ABC',
-            'alamat_toko': 'Jl. Contoh No. 123',
-            'no_hp': '08123456789',
-            'nama_kasir': 'John Doe',
-            'code': '12121211',
-            'tanggal': '2024-09-02 15:30:00',
-            'items': [
-                {
-                    'nama_produk': 'Produk A',
-                    'qty': 2,
-                    'satuan': 'pcs',
-                    'harga': 10000,
-                    'diskon': 1000,
-                    'total_harga': 19000
-                },
-                {
-                    'nama_produk': 'Produk B',
-                    'qty': 1,
-                    'satuan': 'pcs',
-                    'harga': 15000,
-                    'diskon': 0,
-                    'total_harga': 15000
-                }
-            ],
-            'notes': 'Terima kasih telah berbelanja!'
-        }
+    def updatePreview(self):
+        """Render the sample receipt with the fields as they are, without saving them.
+
+        Only sections that changed since the last preview are recompiled;
+        images are left out, the preview shows the text layout.
+        """
+        try:
+            settings = self.templateFields()
+        except TemplateError as e:
+            self.preview_error.setText(str(e))
+            return
+        if settings == self.preview_settings:
+            return
+        self.preview_settings = settings
+        try:
+            self.preview_template = self.receipt_template.compile('preview', dict(DEFAULT_TEMPLATE, **settings),
+                                                                  strict=False, images=False,
+                                                                  previous=self.preview_template)
+            text = self.preview_template.generate_receipt(SAMPLE_RECEIPT)
+        except TemplateError as e:
+            # Keep showing the last good preview while the template is being edited
+            self.preview_error.setText(str(e))
+            return
+        except KeyError as e:
+            self.preview_error.setText(f"The sample receipt has no item field {e}")
+            return
+        self.preview_error.clear()
+        self.template_preview.setPlainText(text)
+
+    def saveTemplate(self):
+        name = self.template_name.currentText().strip() or 'default'
+        try:
+            new_template = self.templateFields()
+            self.receipt_template.update_template(name, **new_template)
+        except TemplateError as e:
+            QMessageBox.warning(self, "Invalid Template", f"Template not saved: {str(e)}")
+            return False
+        if self.template_name.findText(name) < 0:
+            self.template_name.addItem(name)
+        QMessageBox.information(self, "Template Saved", f"Receipt template '{name}' has been updated and saved")
+        return True
 
-        receipt_text = self.receipt_template.generate_receipt(test_data)
+    def testTemplate(self):
+        if not self.saveTemplate():
+            return
 
         if not self.printer_manager.active_printer:
             QMessageBox.warning(self, "No Printer", "Please select a printer first")
             return
 
-        result, status_code = self.printer_manager.print_text(receipt_text)
-        if status_code == 200:
-            QMessageBox.information(self, "Print Success", "Test template printed successfully")
-        else:
-            QMessageBox.warning(self, "Print Error", f"Failed to print: {result}")
+        template = self.receipt_template.get(self.template_name.currentText().strip() or None)
+        self.queueTestPrint(StreamedReceipt(template, dict(SAMPLE_RECEIPT)), "Test template printed successfully")
 
     def printTest(self):
         if not self.printer_manager.active_printer:
             QMessageBox.warning(self, "No Printer", "No active printer selected. Please select a printer first.")
             return
 
-        text = self.test_print_text.toPlainText()
-        result, status_code = self.printer_manager.print_text(text)
-        if status_code == 200:
-            QMessageBox.information(self, "Print Success", "Test print sent successfully")
+        self.queueTestPrint(self.test_print_text.toPlainText(), "Test print sent successfully")
+
+    def queueTestPrint(self, document, success_message):
+        """Queue a test print like /print does: it waits while the printer is held and shows in the Jobs tab."""
+        printer = self.printer_manager.active_printer
+        self.runInBackground(lambda: get_print_queue().submit(printer, document, {'test': True}),
+                             on_finished=lambda job: self.watchTestPrint(job, success_message),
+                             on_failed=lambda error: QMessageBox.warning(self, "Print Error", f"Failed to queue print: {error}"))
+
+    def watchTestPrint(self, job, success_message):
+        # The job may already have finished before this runs on the GUI thread
+        if job.finished.is_set():
+            self.showPrintResult(job, success_message)
+            return
+        self.test_jobs[job.id] = success_message
+        reason = self.printer_manager.status_monitor.hold_reason(job.printer)
+        if reason:
+            QMessageBox.information(self, "Print Held", f"Printer '{job.printer}' is not ready ({reason}), "
+                                                        f"the test print is queued until it is")
+
+    def showPrintResult(self, job, success_message):
+        if job.status == 'done':
+            QMessageBox.information(self, "Print Success", success_message)
         else:
-            QMessageBox.warning(self, "Print Error", f"Failed to print: {result}")
+            QMessageBox.warning(self, "Print Error", f"Failed to print: {job.message}")
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
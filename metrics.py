@@ -0,0 +1,165 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, from sub-millisecond rendering up to slow spooler calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; ``observe`` is a bisect and two additions."""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'printer', 'start')
+
+    def __init__(self, metrics, stage, printer):
+        self.metrics = metrics
+        self.stage = stage
+        self.printer = printer
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.printer)
+        return False
+
+
+class Metrics:
+    """Stage latencies and per-printer counters for the print pipeline.
+
+    Stages are labelled by name (``parse_form``, ``parse_items``, ``render``,
+    ``queue_wait``, ``print``, ...) and optionally by printer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self.gauges = {}  # name -> callable returning {printer: value}
+
+    def timer(self, stage, printer=''):
+        return _Timer(self, stage, printer)
+
+    def observe(self, stage, seconds, printer=''):
+        key = (stage, printer)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, printer='', amount=1, **labels):
+        key = (name, printer, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def job_finished(self, printer, status, nbytes):
+        self.inc('print_jobs_total', printer, status=status)
+        if status == 'done':
+            self.inc('print_bytes_total', printer, nbytes)
+        else:
+            self.inc('print_errors_total', printer)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.quantile(0.5), h.quantile(0.99))
+                          for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        gauges = {}
+        for name, collect in self.gauges.items():
+            try:
+                gauges[name] = collect()
+            except Exception:
+                gauges[name] = {}
+        return histograms, counters, gauges
+
+    def summary(self):
+        """Rows for display: per stage latency and per printer counters."""
+        histograms, counters, gauges = self.snapshot()
+        stages = []
+        for (stage, printer), (_, total, count, p50, p99) in sorted(histograms.items()):
+            stages.append({'stage': stage, 'printer': printer, 'count': count,
+                           'avg_ms': total / count * 1000 if count else 0.0,
+                           'p50_ms': p50 * 1000, 'p99_ms': p99 * 1000})
+        printers = {}
+        for (name, printer, labels), value in counters.items():
+            row = printers.setdefault(printer, {'jobs': 0, 'errors': 0, 'bytes': 0, 'queue_depth': 0})
+            if name == 'print_jobs_total':
+                row['jobs'] += value
+            elif name == 'print_errors_total':
+                row['errors'] += value
+            elif name == 'print_bytes_total':
+                row['bytes'] += value
+        for printer, depth in gauges.get('print_queue_depth', {}).items():
+            printers.setdefault(printer, {'jobs': 0, 'errors': 0, 'bytes': 0, 'queue_depth': 0})['queue_depth'] = depth
+        return {'stages': stages, 'printers': printers}
+
+    def render_prometheus(self):
+        histograms, counters, gauges = self.snapshot()
+        lines = [
+            '# HELP print_stage_seconds Latency of each /print pipeline stage',
+            '# TYPE print_stage_seconds histogram'
+        ]
+        for (stage, printer), (counts, total, count, _, _) in sorted(histograms.items()):
+            labels = _labels(stage=stage, printer=printer)
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'print_stage_seconds_bucket{_labels(stage=stage, printer=printer, le=repr(bound))} {cumulative}')
+            lines.append(f'print_stage_seconds_bucket{_labels(stage=stage, printer=printer, le="+Inf")} {count}')
+            lines.append(f'print_stage_seconds_sum{labels} {total}')
+            lines.append(f'print_stage_seconds_count{labels} {count}')
+
+        by_name = {}
+        for (name, printer, extra), value in sorted(counters.items()):
+            by_name.setdefault(name, []).append((dict(extra, printer=printer), value))
+        for name, samples in by_name.items():
+            lines.append(f'# TYPE {name} counter')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(**labels)} {value}')
+
+        for name, values in sorted(gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            for printer, value in sorted(values.items()):
+                lines.append(f'{name}{_labels(printer=printer)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    parts = []
+    for name, value in labels.items():
+        if value == '' and name == 'printer':
+            continue
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+metrics = Metrics()
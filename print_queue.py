@@ -0,0 +1,300 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import metrics
+
+JOB_QUEUED = 'queued'
+JOB_HELD = 'held'
+JOB_PRINTING = 'printing'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+HOLD_RECHECK_INTERVAL = 1  # Seconds between readiness checks of a held job's printer
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class PrintJob:
+    def __init__(self, printer, text, meta=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.printer = printer
+        self.text = text
+        self.meta = meta or {}
+        self.status = JOB_QUEUED
+        self.message = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = threading.Event()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'printer': self.printer,
+            'status': self.status,
+            'message': self.message,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'meta': self.meta
+        }
+
+
+class PrintQueue:
+    """Background print queue with one worker thread per printer.
+
+    Jobs for the same printer are printed in submission order; jobs for
+    different printers run in parallel. ``print_func(text, printer_name)``
+    must return a ``(message, status_code)`` tuple like
+    ``PrinterManager.print_text``. With a ``journal`` (``JobJournal``) every
+    accepted job and its final status are journaled so unfinished jobs can be
+    replayed with ``replay_journal()`` after a restart.
+
+    ``failover(job, printer, failed)`` is asked before each attempt
+    (``failed=False``) and after a failed one (``failed=True``); when it
+    returns another printer name the job is moved to that printer's queue
+    instead of being printed or marked failed.
+
+    ``hold(printer)`` returns why a printer cannot print right now (paper
+    out, cover open, ...) or ``None``. The next job for such a printer is
+    held until it is ready again or ``failover`` moves it elsewhere.
+
+    A job's ``text`` is usually the document to print, but may also be an
+    object rendered while it prints (``StreamedReceipt``). Such jobs are
+    journaled as ``text.to_dict()`` and ``restore(payload)`` turns that back
+    into a job on replay.
+    """
+
+    def __init__(self, print_func, max_depth=100, history_size=1000, journal=None, failover=None, hold=None,
+                 restore=None):
+        self.print_func = print_func
+        self.journal = journal
+        self.restore = restore
+        self.failover = failover
+        self.hold = hold
+        self.max_depth = max_depth
+        self.history_size = history_size
+        self._queues = {}
+        self._workers = {}
+        self._jobs = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._stopped = threading.Event()
+        self._printing = set()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call ``callback(job)`` from the submitting or worker thread whenever a job changes state."""
+        self._listeners.append(callback)
+
+    def _notify(self, job):
+        for callback in self._listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                logging.error(f"Error in print queue listener: {str(e)}")
+
+    def submit(self, printer, text, meta=None, job_id=None, force=False):
+        job = PrintJob(printer, text, meta, job_id)
+        with self._lock:
+            if self._stopping:
+                raise QueueFullError("Print queue is shutting down")
+            if not force and self._pending.get(printer, 0) >= self.max_depth:
+                raise QueueFullError(f"Print queue for '{printer}' is full ({self.max_depth} jobs)")
+            self._pending[printer] = self._pending.get(printer, 0) + 1
+            self._remember(job)
+            if self.journal:
+                payload = text if isinstance(text, (bytes, str, list)) else text.to_dict()
+                self.journal.record_accepted(job.id, printer, payload, job.meta)
+            job_queue = self._queue_for(printer)
+        job_queue.put(job)
+        self._notify(job)
+        return job
+
+    def _queue_for(self, printer):
+        job_queue = self._queues.get(printer)
+        if job_queue is None:
+            job_queue = self._queues[printer] = queue.Queue()
+            worker = threading.Thread(target=self._worker, args=(printer, job_queue),
+                                      name=f"print-worker-{printer}", daemon=True)
+            self._workers[printer] = worker
+            worker.start()
+        return job_queue
+
+    def _move(self, job, printer, target):
+        """Hand a job over to the queue of another printer; not done once draining has started."""
+        with self._lock:
+            if self._stopping:
+                return False
+            logging.warning(f"Moving print job {job.id} from '{printer}' to '{target}'")
+            self._pending[printer] -= 1
+            self._pending[target] = self._pending.get(target, 0) + 1
+            job.printer = target
+            job.status = JOB_QUEUED
+            job.message = f"Moved from '{printer}'" + (f" after error: {job.message}" if job.message else "")
+            if self.journal:
+                self.journal.record_moved(job.id, target)
+            # Put under the lock, so the job is always ahead of a drain() sentinel
+            self._queue_for(target).put(job)
+        metrics.inc('print_failovers_total', printer)
+        self._notify(job)
+        return True
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        # Drop the oldest finished jobs once the history is full
+        while len(self._jobs) > self.history_size:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.finished.is_set():
+                break
+            del self._jobs[oldest_id]
+
+    def _worker(self, printer, job_queue):
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+            target = self.failover(job, printer, False) if self.failover else None
+            if target and target != printer and self._move(job, printer, target):
+                job_queue.task_done()
+                continue
+            if self.hold:
+                held = self._hold(job, printer)
+                if held == 'moved':
+                    job_queue.task_done()
+                    continue
+                if held == 'stopping':
+                    # Left unfinished in the journal, it is replayed after the restart
+                    job_queue.task_done()
+                    break
+            job.status = JOB_PRINTING
+            job.started_at = time.time()
+            metrics.observe('queue_wait', job.started_at - job.created_at, printer)
+            self._notify(job)
+            self._printing.add(printer)
+            try:
+                with metrics.timer('print', printer):
+                    message, status_code = self.print_func(job.text, printer)
+                job.status = JOB_DONE if status_code == 200 else JOB_FAILED
+                job.message = message
+            except Exception as e:
+                logging.error(f"Print job {job.id} failed: {str(e)}")
+                job.status = JOB_FAILED
+                job.message = str(e)
+            finally:
+                self._printing.discard(printer)
+            if job.status == JOB_FAILED and self.failover:
+                target = self.failover(job, printer, True)
+                if target and target != printer and self._move(job, printer, target):
+                    job_queue.task_done()
+                    continue
+            job.finished_at = time.time()
+            nbytes = len(job.text) if isinstance(job.text, bytes) else getattr(job.text, 'size', 0)
+            metrics.job_finished(printer, job.status, nbytes)
+            job.text = None
+            if self.journal:
+                self.journal.record_status(job.id, job.status, job.message)
+            with self._lock:
+                self._pending[printer] -= 1
+            job.finished.set()
+            self._notify(job)
+            job_queue.task_done()
+
+    def _hold(self, job, printer):
+        """Wait while ``hold(printer)`` gives a reason; returns 'ready', 'moved' or 'stopping'."""
+        reason = self.hold(printer)
+        if reason is None:
+            return 'ready'
+        logging.warning(f"Holding print job {job.id} for '{printer}': {reason}")
+        metrics.inc('print_jobs_held_total', printer)
+        while reason is not None:
+            if job.status != JOB_HELD or job.message != reason:
+                job.status = JOB_HELD
+                job.message = reason
+                self._notify(job)
+            if self._stopped.wait(HOLD_RECHECK_INTERVAL):
+                return 'stopping'
+            target = self.failover(job, printer, False) if self.failover else None
+            if target and target != printer and self._move(job, printer, target):
+                return 'moved'
+            reason = self.hold(printer)
+        logging.info(f"Printer '{printer}' is ready, releasing print job {job.id}")
+        job.message = None
+        return 'ready'
+
+    def printing(self, printer):
+        """Whether a job is being sent to ``printer`` right now."""
+        return printer in self._printing
+
+    def replay_journal(self):
+        """Resubmit the jobs the journal holds as accepted but never finished."""
+        if not self.journal:
+            return []
+        jobs = []
+        for record in self.journal.unfinished_jobs():
+            logging.info(f"Replaying unfinished print job {record['job_id']} on '{record['printer']}'")
+            text = record['text']
+            if isinstance(text, dict):
+                if not self.restore:
+                    logging.error(f"Cannot replay print job {record['job_id']}: no way to restore its receipt")
+                    continue
+                text = self.restore(text)
+            # Replayed jobs were already accepted, so the queue depth limit does not apply
+            jobs.append(self.submit(record['printer'], text, record.get('meta'),
+                                    record['job_id'], force=True))
+        if jobs:
+            # The replayed jobs are journaled again, so older segments can be dropped
+            self.journal.compact()
+        return jobs
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, status=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if status:
+            jobs = [job for job in jobs if job.status == status]
+        return jobs
+
+    def depth(self, printer=None):
+        with self._lock:
+            if printer is not None:
+                return self._pending.get(printer, 0)
+            return dict(self._pending)
+
+    def drain(self, timeout=None):
+        """Stop accepting jobs and wait for queued jobs to finish.
+
+        Jobs held for a printer that is not ready are not waited for; they
+        stay in the journal and are replayed on the next start. The journal
+        is flushed before returning (and closed once every worker stopped),
+        as its writer thread dies with the process.
+        """
+        with self._lock:
+            self._stopping = True
+            self._stopped.set()
+            queues = list(self._queues.values())
+            workers = list(self._workers.values())
+        for job_queue in queues:
+            job_queue.put(None)
+        deadline = None if timeout is None else time.time() + timeout
+        for worker in workers:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            worker.join(remaining)
+        drained = all(not worker.is_alive() for worker in workers)
+        if self.journal:
+            if drained:
+                self.journal.close()
+            else:
+                # A worker still printing may journal its status later, keep the writer running
+                self.journal.flush(None if deadline is None else max(0, deadline - time.time()))
+        return drained
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class RoutingError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures of one printer.
+
+    After ``failure_threshold`` failures in a row the breaker opens and the
+    printer is skipped when choosing a printer. Once ``reset_timeout``
+    seconds have passed it is half open: jobs may go to it again, and the
+    next failure opens it again straight away. A success (or a passing
+    health check) closes it.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_check = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return BREAKER_CLOSED
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return BREAKER_HALF_OPEN
+        return BREAKER_OPEN
+
+    def available(self):
+        return self.state != BREAKER_OPEN
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logging.info(f"Printer '{self.name}' recovered, closing circuit breaker")
+            self.failures = 0
+            self.opened_at = None
+            self.last_error = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.failures >= self.failure_threshold:
+                if self.failures == self.failure_threshold:
+                    logging.warning(f"Printer '{self.name}' failed {self.failures} times in a row, "
+                                    f"opening circuit breaker")
+                self.opened_at = time.time()
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_check': self.last_check
+        }
+
+
+class PrinterPool:
+    def __init__(self, name, printers, paper_size=None):
+        if not printers:
+            raise ValueError(f"Printer pool '{name}' has no printers")
+        self.name = name
+        self.printers = list(printers)
+        self.paper_size = paper_size
+
+
+class PrinterRouter:
+    """Picks the printer for a job from the ``pools`` and ``stations`` in mosys.json.
+
+    ``depth_func(printer)`` returns the number of jobs waiting for a printer;
+    within a pool the available printer with the fewest waiting jobs is
+    chosen, earlier printers in the pool winning ties. ``ready_func(printer)``
+    is false while a printer reports it cannot print (paper out, ...), which
+    makes it unavailable just like an open circuit breaker.
+    """
+
+    def __init__(self, config=None, depth_func=None):
+        config = config or {}
+        self.pools = {name: PrinterPool(name, pool.get('printers', []), pool.get('paper_size'))
+                      for name, pool in config.get('pools', {}).items()}
+        self.stations = dict(config.get('stations', {}))
+        self.default_pool = config.get('default_pool')
+        breaker_config = config.get('circuit_breaker', {})
+        self.failure_threshold = breaker_config.get('failure_threshold', 3)
+        self.reset_timeout = breaker_config.get('reset_timeout', 30)
+        self.health_check_interval = config.get('health_check_interval', 10)
+        self.depth_func = depth_func or (lambda printer: 0)
+        self.ready_func = lambda printer: True
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    def breaker(self, printer):
+        with self._lock:
+            breaker = self._breakers.get(printer)
+            if breaker is None:
+                breaker = self._breakers[printer] = CircuitBreaker(printer, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def available(self, printer):
+        return self.breaker(printer).available() and self.ready_func(printer)
+
+    def pooled_printers(self):
+        printers = []
+        for pool in self.pools.values():
+            printers.extend(printer for printer in pool.printers if printer not in printers)
+        return printers
+
+    def pools_of(self, printer):
+        return [pool.name for pool in self.pools.values() if printer in pool.printers]
+
+    def pick(self, pool_name, exclude=()):
+        """Least busy available printer in the pool, or ``None`` if every printer is down."""
+        candidates = [printer for printer in self.pools[pool_name].printers
+                      if printer not in exclude and self.available(printer)]
+        if not candidates:
+            return None
+        return min(candidates, key=self.depth_func)
+
+    def route(self, printer=None, station=None, paper_size=None, default_printer=None):
+        """Return ``(printer, pool_name)`` for a request.
+
+        ``printer`` may name a pool or a single printer, ``station`` is looked
+        up in ``stations``; without either the pool for ``paper_size`` or the
+        ``default_pool`` is used, and finally ``default_printer``.
+        """
+        if station:
+            if station not in self.stations:
+                raise RoutingError(f"Unknown station '{station}'")
+            printer = printer or self.stations[station]
+        if printer and printer not in self.pools:
+            return printer, None
+
+        pool_name = printer
+        if pool_name is None and paper_size:
+            pool_name = next((pool.name for pool in self.pools.values() if pool.paper_size == paper_size), None)
+        if pool_name is None:
+            pool_name = self.default_pool
+        if pool_name is None:
+            return default_printer, None
+        if pool_name not in self.pools:
+            raise RoutingError(f"Unknown printer pool '{pool_name}'")
+
+        chosen = self.pick(pool_name)
+        if chosen is None:
+            raise RoutingError(f"No printer available in pool '{pool_name}'", 503)
+        return chosen, pool_name
+
+    def failover(self, job, printer, failed):
+        """``PrintQueue`` failover hook: where to move ``job`` instead of ``printer``, if anywhere.
+
+        Before printing a job is moved only when the breaker of its printer
+        is open; after a failed attempt it is moved to any other available
+        printer of its pool that has not been tried yet.
+        """
+        pool_name = job.meta.get('pool')
+        if pool_name not in self.pools or (not failed and self.available(printer)):
+            return None
+        tried = job.meta.setdefault('tried', [])
+        if printer not in tried:
+            tried.append(printer)
+        return self.pick(pool_name, exclude=tried)
+
+    def start_health_checks(self, check_func):
+        """Check pooled printers every ``health_check_interval`` seconds in the background.
+
+        ``check_func(printer)`` raises when the printer cannot be reached.
+        Busy printers are not checked, their jobs already report failures.
+        """
+        if self._health_thread is not None or not self.pools:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, args=(check_func,),
+                                               name="printer-health-check", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self, check_func):
+        while not self._stop.wait(self.health_check_interval):
+            for printer in self.pooled_printers():
+                if self.depth_func(printer):
+                    continue
+                self.check(printer, check_func)
+
+    def check(self, printer, check_func):
+        breaker = self.breaker(printer)
+        breaker.last_check = time.time()
+        try:
+            check_func(printer)
+        except Exception as e:
+            breaker.record_failure(f"Health check failed: {str(e)}")
+            return False
+        breaker.record_success()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self, printers):
+        return [dict(self.breaker(printer).to_dict(), name=printer,
+                     available=self.available(printer),
+                     queue_depth=self.depth_func(printer),
+                     pools=self.pools_of(printer))
+                for printer in printers]
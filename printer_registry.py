@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+
+class PrinterRegistry:
+    """Cached printer list refreshed in the background.
+
+    ``enumerate_func`` returns the list of printer names; it is only called
+    on the first lookup, from the refresh thread once the cache is older than
+    ``ttl`` seconds, or when ``refresh()`` is called explicitly. Lookups
+    return the cached list immediately, even while a refresh is running.
+    """
+
+    def __init__(self, enumerate_func, ttl=30):
+        self.enumerate_func = enumerate_func
+        self.ttl = ttl
+        self.version = 0
+        self._printers = None
+        self._names = frozenset()
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call ``callback(printers)`` whenever the printer list changes."""
+        self._listeners.append(callback)
+
+    def get_printers(self):
+        if self._printers is None:
+            self.refresh(wait=True)
+        elif time.time() - self._loaded_at > self.ttl:
+            self.refresh()
+        return list(self._printers or [])
+
+    def __contains__(self, printer_name):
+        self.get_printers()
+        return printer_name in self._names
+
+    def refresh(self, wait=False):
+        with self._lock:
+            thread = self._refreshing
+            if thread is None:
+                thread = threading.Thread(target=self._refresh, name="printer-registry-refresh", daemon=True)
+                self._refreshing = thread
+                thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _refresh(self):
+        try:
+            try:
+                printers = self.enumerate_func()
+            except Exception as e:
+                logging.error(f"Error enumerating printers: {str(e)}")
+                printers = self._printers or []
+            changed = self._printers is not None and printers != self._printers
+            self._printers = printers
+            self._names = frozenset(printers)
+            self._loaded_at = time.time()
+        finally:
+            with self._lock:
+                self._refreshing = None
+        if changed:
+            self.version += 1
+            logging.info(f"Printer list changed: {printers}")
+            for callback in self._listeners:
+                try:
+                    callback(list(printers))
+                except Exception as e:
+                    logging.error(f"Error in printer list listener: {str(e)}")
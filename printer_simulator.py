@@ -0,0 +1,201 @@
+"""Simulated ESC/POS network printer for trying the server without hardware.
+
+It listens like a JetDirect printer (raw TCP), keeps what it receives and
+answers ``DLE EOT`` real-time status queries from its current state, so
+paper-out, cover-open and offline handling can be exercised:
+
+    python printer_simulator.py --port 9100
+
+and in mosys.json: ``"printers": {"SIM": {"transport": "tcp", "host": "127.0.0.1", "port": 9100}}``.
+While it runs, type ``ready``, ``paper_low``, ``paper_out``, ``cover_open``,
+``offline`` or ``error`` to change its state, ``jobs`` to count the
+received receipts and ``quit`` to stop.
+
+For benchmarks it can also behave like a slow or flaky printer: ``latency``
+seconds of print time per receipt (the printer stops reading meanwhile, so
+the sender sees TCP back-pressure and late status replies) and a
+``fail_rate`` share of receipts at whose paper cut the connection is reset.
+``seed`` makes the injected failures repeatable.
+"""
+import argparse
+import logging
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+from escpos import CUT
+from printer_status import DLE_EOT
+
+DLE = DLE_EOT[:1]
+STATES = ('ready', 'paper_low', 'paper_out', 'cover_open', 'offline', 'error')
+
+
+class InjectedFailure(Exception):
+    """A receipt chosen by ``fail_rate`` to fail."""
+
+
+class SimulatedPrinter:
+    """A raw TCP ESC/POS printer in a background thread.
+
+    ``state`` is one of ``STATES``; with ``answer_status=False`` it behaves
+    like a printer without real-time status support and never replies.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, state='ready', answer_status=True,
+                 latency=0, fail_rate=0, seed=None):
+        self.state = state
+        self.answer_status = answer_status
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.data = bytearray()
+        self.status_queries = 0
+        self.receipts = 0  # Paper cuts received, including failed receipts
+        self.failures = 0  # Receipts whose connection was reset
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()[:2]
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def port(self):
+        return self.address[1]
+
+    def status_byte(self, n):
+        """Reply to ``DLE EOT n`` for the current state."""
+        state = self.state
+        byte = 0x12
+        if n == 1 and state == 'offline':
+            byte |= 0x08
+        elif n == 2:
+            if state == 'cover_open':
+                byte |= 0x04
+            if state == 'paper_out':
+                byte |= 0x20
+            if state == 'error':
+                byte |= 0x40
+        elif n == 4:
+            if state in ('paper_low', 'paper_out'):
+                byte |= 0x0C
+            if state == 'paper_out':
+                byte |= 0x60
+        return byte
+
+    def jobs(self):
+        """Received receipts, split at the paper cut."""
+        with self._lock:
+            data = bytes(self.data)
+        return [job + CUT for job in data.split(CUT)[:-1]]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, name="printer-simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping = True
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+
+    def _accept_loop(self):
+        while not self._stopping:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            # Status replies are single bytes, Nagle would hold them back behind delayed ACKs
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        pending = b''
+        # End of the stored data, a cut command may be split across reads
+        connection = {'tail': b''}
+        with conn:
+            while True:
+                try:
+                    data = conn.recv(65536)
+                except OSError:
+                    break
+                if not data:
+                    break
+                try:
+                    pending = self._process(conn, pending + data, connection)
+                except InjectedFailure:
+                    # Reset instead of a clean close, like a printer that lost power or jammed
+                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                    break
+
+    def _process(self, conn, data, connection):
+        """Store job bytes and answer the status queries in them; returns an incomplete query to keep."""
+        start = 0
+        while True:
+            index = data.find(DLE_EOT, start)
+            if index < 0:
+                end = len(data) - 1 if data.endswith(DLE) else len(data)
+                self._store(data[start:end], connection)
+                return data[end:]
+            self._store(data[start:index], connection)
+            if index + 2 >= len(data):
+                return data[index:]
+            self.status_queries += 1
+            if self.answer_status:
+                conn.sendall(bytes([self.status_byte(data[index + 2])]))
+            start = index + 3
+
+    def _store(self, data, connection):
+        if not data:
+            return
+        with self._lock:
+            self.data += data
+        data = connection['tail'] + data
+        connection['tail'] = data[-(len(CUT) - 1):]
+        # Print time is spent before later status queries are answered, as on a real printer
+        for _ in range(data.count(CUT)):
+            with self._lock:
+                self.receipts += 1
+                failed = self.fail_rate > 0 and self._random.random() < self.fail_rate
+                if failed:
+                    self.failures += 1
+            if failed:
+                raise InjectedFailure()
+            if self.latency:
+                time.sleep(self.latency)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Simulated ESC/POS network printer")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--state', choices=STATES, default='ready')
+    parser.add_argument('--no-status', action='store_true', help="do not answer DLE EOT status queries")
+    parser.add_argument('--latency', type=float, default=0, help="print time per receipt in seconds")
+    parser.add_argument('--fail-rate', type=float, default=0,
+                        help="share of receipts (0-1) whose connection is reset at the paper cut")
+    parser.add_argument('--seed', type=int, help="random seed for repeatable failures")
+    args = parser.parse_args()
+
+    printer = SimulatedPrinter(args.host, args.port, args.state, not args.no_status,
+                               args.latency, args.fail_rate, args.seed).start()
+    logging.info(f"Simulated printer listening on {args.host}:{printer.port} ({printer.state})")
+    for line in sys.stdin:
+        command = line.strip()
+        if command in STATES:
+            printer.state = command
+            logging.info(f"State: {command}")
+        elif command == 'jobs':
+            logging.info(f"{len(printer.jobs())} receipts, {len(printer.data)} bytes, "
+                         f"{printer.status_queries} status queries, {printer.failures} failures")
+        elif command == 'quit':
+            break
+        elif command:
+            logging.info(f"Unknown command '{command}', use {', '.join(STATES)}, jobs or quit")
+    printer.stop()
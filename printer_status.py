@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+
+from metrics import metrics
+
+DLE_EOT = b"\x10\x04"
+# DLE EOT n: 1 = printer status, 2 = offline cause, 4 = roll paper sensor
+STATUS_QUERY = DLE_EOT + b"\x01" + DLE_EOT + b"\x02" + DLE_EOT + b"\x04"
+
+STATUS_READY = 'ready'
+STATUS_PAPER_LOW = 'paper_low'
+STATUS_PAPER_OUT = 'paper_out'
+STATUS_COVER_OPEN = 'cover_open'
+STATUS_OFFLINE = 'offline'
+STATUS_ERROR = 'error'
+STATUS_UNKNOWN = 'unknown'
+
+# States in which a printer cannot print; paper_low still prints
+NOT_READY = (STATUS_PAPER_OUT, STATUS_COVER_OPEN, STATUS_OFFLINE, STATUS_ERROR)
+
+STATUS_MESSAGES = {
+    STATUS_PAPER_OUT: "Paper out",
+    STATUS_COVER_OPEN: "Cover open",
+    STATUS_OFFLINE: "Printer offline",
+    STATUS_ERROR: "Printer error"
+}
+
+# Windows spooler PRINTER_STATUS_* and JOB_STATUS_* flags
+PRINTER_STATUS_PAUSED = 0x1
+PRINTER_STATUS_ERROR = 0x2
+PRINTER_STATUS_PAPER_JAM = 0x8
+PRINTER_STATUS_PAPER_OUT = 0x10
+PRINTER_STATUS_PAPER_PROBLEM = 0x40
+PRINTER_STATUS_OFFLINE = 0x80
+PRINTER_STATUS_NOT_AVAILABLE = 0x1000
+PRINTER_STATUS_USER_INTERVENTION = 0x100000
+PRINTER_STATUS_DOOR_OPEN = 0x400000
+JOB_STATUS_ERROR = 0x2
+JOB_STATUS_OFFLINE = 0x20
+JOB_STATUS_PAPEROUT = 0x40
+JOB_STATUS_BLOCKED_DEVQ = 0x200
+JOB_STATUS_USER_INTERVENTION = 0x400
+
+
+class PrinterStatus:
+    """Status of one printer at ``checked_at``; ``state`` is the most severe condition."""
+
+    def __init__(self, state, message=None, details=None, checked_at=None):
+        self.state = state
+        self.message = message or STATUS_MESSAGES.get(state)
+        self.details = details or {}
+        self.checked_at = checked_at or time.time()
+
+    @property
+    def ready(self):
+        return self.state not in NOT_READY
+
+    def to_dict(self):
+        return dict(self.details, state=self.state, ready=self.ready, message=self.message,
+                    checked_at=self.checked_at)
+
+
+def _valid_status_byte(byte):
+    # Bits 1 and 4 are always set and bits 0 and 7 always clear in a DLE EOT reply
+    return byte & 0x93 == 0x12
+
+
+def decode_escpos_status(reply):
+    """Decode the replies to ``STATUS_QUERY`` (printer, offline cause, paper sensor)."""
+    if len(reply) < 3 or not all(_valid_status_byte(byte) for byte in reply[:3]):
+        return PrinterStatus(STATUS_UNKNOWN, f"Unexpected status reply {reply.hex() or 'none'}")
+    printer, offline, paper = reply[:3]
+    details = {
+        'online': not printer & 0x08,
+        'cover_open': bool(offline & 0x04),
+        'paper_out': bool(paper & 0x60) or bool(offline & 0x20),
+        'paper_low': bool(paper & 0x0C),
+        'error': bool(offline & 0x40)
+    }
+    if details['cover_open']:
+        state = STATUS_COVER_OPEN
+    elif details['paper_out']:
+        state = STATUS_PAPER_OUT
+    elif details['error']:
+        state = STATUS_ERROR
+    elif not details['online']:
+        state = STATUS_OFFLINE
+    elif details['paper_low']:
+        state = STATUS_PAPER_LOW
+    else:
+        state = STATUS_READY
+    return PrinterStatus(state, details=details)
+
+
+def decode_spooler_status(printer_status, job_statuses=()):
+    """Map the spooler status of a printer and of its queued jobs to a ``PrinterStatus``."""
+    job_flags = 0
+    for job_status in job_statuses:
+        job_flags |= job_status
+    details = {'spooler_status': printer_status, 'jobs': len(job_statuses)}
+    if printer_status & PRINTER_STATUS_DOOR_OPEN:
+        state = STATUS_COVER_OPEN
+    elif printer_status & (PRINTER_STATUS_PAPER_OUT | PRINTER_STATUS_PAPER_PROBLEM) or job_flags & JOB_STATUS_PAPEROUT:
+        state = STATUS_PAPER_OUT
+    elif printer_status & (PRINTER_STATUS_OFFLINE | PRINTER_STATUS_NOT_AVAILABLE | PRINTER_STATUS_PAUSED) \
+            or job_flags & JOB_STATUS_OFFLINE:
+        state = STATUS_OFFLINE
+    elif printer_status & (PRINTER_STATUS_ERROR | PRINTER_STATUS_PAPER_JAM | PRINTER_STATUS_USER_INTERVENTION) \
+            or job_flags & (JOB_STATUS_ERROR | JOB_STATUS_BLOCKED_DEVQ | JOB_STATUS_USER_INTERVENTION):
+        state = STATUS_ERROR
+    else:
+        state = STATUS_READY
+    return PrinterStatus(state, details=details)
+
+
+class PrinterStatusMonitor:
+    """Polls the status of each watched printer on its own thread and caches the result.
+
+    ``status_func(printer)`` returns a ``PrinterStatus`` or ``None`` when the
+    printer cannot report one; it may raise when the printer is unreachable,
+    which counts as offline. ``busy_func(printer)`` tells whether a job is
+    being sent right now, polls are skipped then so they never compete with
+    the job for the printer's connection.
+    """
+
+    def __init__(self, status_func, interval=5, busy_func=None):
+        self.status_func = status_func
+        self.interval = interval
+        self.busy_func = busy_func or (lambda printer: False)
+        self._statuses = {}
+        self._counters = {}
+        self._wakeups = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def watch(self, printer):
+        with self._lock:
+            if printer in self._threads or self.interval <= 0:
+                return
+            self._wakeups[printer] = threading.Event()
+            self._counters[printer] = {'polls': 0, 'poll_errors': 0, 'changes': {}}
+            thread = self._threads[printer] = threading.Thread(target=self._poll_loop, args=(printer,),
+                                                               name=f"printer-status-{printer}", daemon=True)
+        thread.start()
+
+    def wake(self, printer):
+        """Poll ``printer`` now instead of at the next interval, e.g. after a job was sent."""
+        wakeup = self._wakeups.get(printer)
+        if wakeup is not None:
+            wakeup.set()
+
+    def _poll_loop(self, printer):
+        wakeup = self._wakeups[printer]
+        while not self._stop.is_set():
+            if not self.busy_func(printer):
+                self.poll(printer)
+            wakeup.wait(self.interval)
+            wakeup.clear()
+
+    def poll(self, printer):
+        counters = self._counters.setdefault(printer, {'polls': 0, 'poll_errors': 0, 'changes': {}})
+        counters['polls'] += 1
+        try:
+            status = self.status_func(printer)
+        except Exception as e:
+            counters['poll_errors'] += 1
+            status = PrinterStatus(STATUS_OFFLINE, f"Status check failed: {str(e)}")
+        if status is None:
+            return None
+        previous = self._statuses.get(printer)
+        self._statuses[printer] = status
+        if previous is None or previous.state != status.state:
+            counters['changes'][status.state] = counters['changes'].get(status.state, 0) + 1
+            metrics.inc('printer_status_changes_total', printer, state=status.state)
+            if previous is not None or not status.ready:
+                log = logging.info if status.ready else logging.warning
+                log(f"Printer '{printer}' status: {status.state}" + (f" ({status.message})" if status.message else ""))
+        return status
+
+    def get(self, printer):
+        return self._statuses.get(printer)
+
+    def hold_reason(self, printer):
+        """Why jobs for ``printer`` must wait, or ``None``; printers without a known status are never held."""
+        status = self._statuses.get(printer)
+        if status is None or status.ready:
+            return None
+        return status.message or status.state
+
+    def ready(self, printer):
+        return self.hold_reason(printer) is None
+
+    def to_dict(self, printer):
+        status = self._statuses.get(printer)
+        counters = self._counters.get(printer, {'polls': 0, 'poll_errors': 0, 'changes': {}})
+        result = status.to_dict() if status else {'state': STATUS_UNKNOWN, 'ready': True, 'message': None,
+                                                  'checked_at': None}
+        return dict(result, polls=counters['polls'], poll_errors=counters['poll_errors'],
+                    changes=dict(counters['changes']))
+
+    def printers(self):
+        return list(self._threads)
+
+    def stop(self):
+        self._stop.set()
+        for wakeup in list(self._wakeups.values()):
+            wakeup.set()
@@ -0,0 +1,274 @@
+import logging
+import os
+import queue
+import select
+import socket
+import threading
+
+from metrics import metrics
+from printer_status import STATUS_QUERY, decode_escpos_status, decode_spooler_status
+
+try:
+    import win32print
+except ImportError:  # Not on Windows, only the tcp and file transports are available
+    win32print = None
+
+
+class TransportError(Exception):
+    pass
+
+
+class PrinterTransport:
+    """Sends a complete ESC/POS byte stream to a printer.
+
+    ``send`` and ``send_stream`` return the ``PrinterStatus`` read right
+    after the job when the transport checks it, otherwise ``None``.
+    """
+
+    def send(self, data):
+        raise NotImplementedError
+
+    def send_stream(self, chunks):
+        """Send a document given as an iterable of byte chunks, as one job.
+
+        Transports that can write while the chunks are still being produced
+        override this; the default collects them and calls ``send``.
+        """
+        return self.send(b''.join(chunks))
+
+    def check(self):
+        """Raise if the printer cannot be reached; used by the pool health checks."""
+
+    def status(self):
+        """Current ``PrinterStatus``, or ``None`` if this transport cannot tell."""
+        return None
+
+    def close(self):
+        pass
+
+
+class Win32SpoolerTransport(PrinterTransport):
+    def __init__(self, printer_name):
+        if win32print is None:
+            raise TransportError("win32print is not available on this platform")
+        self.printer_name = printer_name
+
+    def send(self, data):
+        return self.send_stream((data,))
+
+    def send_stream(self, chunks):
+        # Each spooler call is timed on its own, a busy spooler usually blocks in one of them
+        printer = self.printer_name
+        with metrics.timer('spooler_open', printer):
+            hPrinter = win32print.OpenPrinter(printer)
+        try:
+            with metrics.timer('spooler_start', printer):
+                hJob = win32print.StartDocPrinter(hPrinter, 1, ("Print Job", None, "RAW"))
+            try:
+                win32print.StartPagePrinter(hPrinter)
+                for chunk in chunks:
+                    with metrics.timer('spooler_write', printer):
+                        win32print.WritePrinter(hPrinter, chunk)
+                win32print.EndPagePrinter(hPrinter)
+            finally:
+                with metrics.timer('spooler_end', printer):
+                    win32print.EndDocPrinter(hPrinter)
+        finally:
+            with metrics.timer('spooler_close', printer):
+                win32print.ClosePrinter(hPrinter)
+
+    def check(self):
+        win32print.ClosePrinter(win32print.OpenPrinter(self.printer_name))
+
+    def status(self):
+        hPrinter = win32print.OpenPrinter(self.printer_name)
+        try:
+            info = win32print.GetPrinter(hPrinter, 2)
+            jobs = win32print.EnumJobs(hPrinter, 0, -1, 1) if info.get('cJobs') else ()
+        finally:
+            win32print.ClosePrinter(hPrinter)
+        return decode_spooler_status(info.get('Status', 0), [job.get('Status', 0) for job in jobs])
+
+
+class TcpTransport(PrinterTransport):
+    """Raw TCP (JetDirect, port 9100) transport with a keep-alive connection pool.
+
+    A connection is taken from the pool for each job and returned afterwards.
+    If sending fails on a pooled connection (the printer may have dropped it
+    while idle), the job is retried once on a fresh connection.
+    """
+
+    def __init__(self, host, port=9100, timeout=10, pool_size=2, status_timeout=2):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.status_timeout = status_timeout
+        # Learned from the first status query; printers without DLE EOT are not asked after each job
+        self.status_supported = None
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _acquire(self):
+        while True:
+            try:
+                sock = self._pool.get_nowait()
+            except queue.Empty:
+                return self._connect(), False
+            if self._is_alive(sock):
+                return sock, True
+            sock.close()
+
+    @staticmethod
+    def _is_alive(sock):
+        # A readable idle socket either has unsolicited status bytes or was closed by the printer
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable:
+                return sock.recv(1024) != b''
+            return True
+        except OSError:
+            return False
+
+    def _release(self, sock):
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def send(self, data):
+        return self.send_stream((data,))
+
+    def send_stream(self, chunks):
+        """Send the chunks on one connection as they come.
+
+        Only the first chunk can be retried on a fresh connection; once part
+        of the job reached the printer, an error fails the job.
+        """
+        chunks = iter(chunks)
+        first = next(chunks, b'')
+        sock, pooled = self._acquire()
+        try:
+            sock.sendall(first)
+        except OSError as e:
+            sock.close()
+            if not pooled:
+                raise TransportError(f"Error sending to {self.host}:{self.port}: {str(e)}")
+            logging.info(f"Reconnecting to printer {self.host}:{self.port} after error: {str(e)}")
+            sock = self._connect()
+            try:
+                sock.sendall(first)
+            except OSError as e:
+                sock.close()
+                raise TransportError(f"Error sending to {self.host}:{self.port}: {str(e)}")
+        try:
+            for chunk in chunks:
+                sock.sendall(chunk)
+            status = self._query_status(sock) if self.status_supported else None
+        except OSError as e:
+            sock.close()
+            raise TransportError(f"Error sending to {self.host}:{self.port}: {str(e)}")
+        except BaseException:
+            # The document was cut off while rendering, do not reuse the connection mid-command
+            sock.close()
+            raise
+        if self.status_supported and status is None:
+            # A late reply would be mistaken for the next one, so the connection is dropped
+            sock.close()
+        else:
+            self._release(sock)
+        return status
+
+    def _query_status(self, sock):
+        """Ask for the real-time status (DLE EOT) on ``sock``; ``None`` if the printer does not answer."""
+        sock.settimeout(self.status_timeout)
+        try:
+            sock.sendall(STATUS_QUERY)
+            reply = b''
+            while len(reply) < 3:
+                data = sock.recv(3 - len(reply))
+                if not data:
+                    raise OSError("Connection closed by printer")
+                reply += data
+        except socket.timeout:
+            return None
+        finally:
+            sock.settimeout(self.timeout)
+        return decode_escpos_status(reply)
+
+    def status(self):
+        sock, _ = self._acquire()
+        try:
+            status = self._query_status(sock)
+        except OSError:
+            sock.close()
+            raise
+        if status is None:
+            # A late reply would be mistaken for the next one, so the connection is dropped
+            sock.close()
+            if self.status_supported is None:
+                logging.info(f"Printer {self.host}:{self.port} does not answer status queries (DLE EOT)")
+            self.status_supported = False
+            return None
+        self.status_supported = True
+        self._release(sock)
+        return status
+
+    def check(self):
+        try:
+            sock, _ = self._acquire()
+        except OSError as e:
+            raise TransportError(f"Cannot connect to {self.host}:{self.port}: {str(e)}")
+        self._release(sock)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class FileTransport(PrinterTransport):
+    """Writes jobs to a character device such as /dev/usb/lp0, or appends them to a plain file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, data):
+        return self.send_stream((data,))
+
+    def send_stream(self, chunks):
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    f.flush()
+
+    def check(self):
+        target = self.path if os.path.exists(self.path) else os.path.dirname(os.path.abspath(self.path))
+        if not os.access(target, os.W_OK):
+            raise TransportError(f"'{self.path}' is not writable")
+
+
+def create_transport(printer_name, config=None):
+    """Build a transport from a printer entry in the ``printers`` section of mosys.json.
+
+    Printers without an entry use the Windows spooler.
+    """
+    config = config or {}
+    kind = config.get('transport', 'win32')
+    if kind == 'tcp':
+        return TcpTransport(config['host'], int(config.get('port', 9100)),
+                            timeout=config.get('timeout', 10), pool_size=config.get('pool_size', 2),
+                            status_timeout=config.get('status_timeout', 2))
+    if kind == 'file':
+        return FileTransport(config['path'])
+    if kind == 'win32':
+        return Win32SpoolerTransport(printer_name)
+    raise TransportError(f"Unknown transport '{kind}' for printer '{printer_name}'")
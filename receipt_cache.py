@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+
+class CachedReceipt:
+    def __init__(self, code, job_id, accepted_at, size, streamed=False):
+        self.code = code
+        self.job_id = job_id
+        self.accepted_at = accepted_at
+        self.size = size
+        self.streamed = streamed  # The data is the receipt as JSON, rendered again when reprinted
+
+
+class ReceiptCache:
+    """LRU cache of rendered receipt documents, bounded by total byte size.
+
+    Entries pushed out of memory are written to ``spill_dir`` (when set) and
+    read back on demand; the spill area has its own byte limit, after which
+    the oldest spilled receipts are deleted.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, spill_dir=None, spill_max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled = OrderedDict()
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, code):
+        return os.path.join(self.spill_dir, hashlib.sha256(code.encode('utf-8')).hexdigest() + '.bin')
+
+    def put(self, code, data, job_id, accepted_at, streamed=False):
+        entry = CachedReceipt(code, job_id, accepted_at, len(data), streamed)
+        with self._lock:
+            self._discard(code)
+            self._memory[code] = (entry, data)
+            self._memory_bytes += entry.size
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                old_code, (old_entry, old_data) = self._memory.popitem(last=False)
+                self._memory_bytes -= old_entry.size
+                self._spill(old_entry, old_data)
+
+    def _discard(self, code):
+        if code in self._memory:
+            entry, _ = self._memory.pop(code)
+            self._memory_bytes -= entry.size
+        if code in self._spilled:
+            entry = self._spilled.pop(code)
+            self._spilled_bytes -= entry.size
+            self._remove_file(code)
+
+    def _remove_file(self, code):
+        try:
+            os.remove(self._spill_path(code))
+        except OSError:
+            pass
+
+    def _spill(self, entry, data):
+        if not self.spill_dir:
+            return
+        try:
+            with open(self._spill_path(entry.code), 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            logging.error(f"Error spilling cached receipt '{entry.code}': {str(e)}")
+            return
+        self._spilled[entry.code] = entry
+        self._spilled_bytes += entry.size
+        while self._spilled_bytes > self.spill_max_bytes and self._spilled:
+            old_code, old_entry = self._spilled.popitem(last=False)
+            self._spilled_bytes -= old_entry.size
+            self._remove_file(old_code)
+
+    def get_entry(self, code):
+        """Return the ``CachedReceipt`` for ``code`` without loading its bytes."""
+        with self._lock:
+            if code in self._memory:
+                return self._memory[code][0]
+            return self._spilled.get(code)
+
+    def get(self, code):
+        """Return ``(entry, data)`` for ``code``, or ``None`` if it is not cached."""
+        with self._lock:
+            if code in self._memory:
+                self._memory.move_to_end(code)
+                return self._memory[code]
+            entry = self._spilled.get(code)
+            if entry is None:
+                return None
+            path = self._spill_path(code)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return entry, data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._memory),
+                'bytes': self._memory_bytes,
+                'spilled_entries': len(self._spilled),
+                'spilled_bytes': self._spilled_bytes
+            }
+
+
+class RecentSubmissions:
+    """Idempotency keys of recently accepted print jobs, kept for ``window`` seconds."""
+
+    def __init__(self, window=300, max_entries=10000):
+        self.window = window
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        """Return the job ID accepted for ``key`` within the window, or ``None``."""
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def add(self, key, job_id, now):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (job_id, now)
+            self._expire(now)
+
+    def _expire(self, now):
+        while self._entries:
+            _, (_, accepted_at) = next(iter(self._entries.items()))
+            if now - accepted_at <= self.window and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
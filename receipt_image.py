@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import threading
+
+BAND_HEIGHT = 256  # Rows per GS v 0 command, some printers reject taller rasters
+
+# 8x8 Bayer matrix scaled to 0..255 thresholds for ordered dithering
+_BAYER_8 = [
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+]
+
+
+class ImageError(Exception):
+    pass
+
+
+def dither(image, width):
+    """Resize a Pillow image to ``width`` dots and convert it to a 1-bit array (True = black)."""
+    import numpy as np
+    from PIL import Image
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Transparent areas print as white paper
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    gray = image.convert('L')
+    height = max(1, round(gray.height * width / gray.width))
+    gray = gray.resize((width, height), Image.LANCZOS)
+
+    pixels = np.asarray(gray, dtype=np.uint16)
+    bayer = (np.array(_BAYER_8, dtype=np.uint16) * 4 + 2)
+    thresholds = np.tile(bayer, (height // 8 + 1, width // 8 + 1))[:height, :width]
+    return pixels < thresholds
+
+
+def pack_raster(bits):
+    """Pack a 1-bit array into ESC/POS ``GS v 0`` raster commands."""
+    import numpy as np
+
+    height, width = bits.shape
+    packed = np.packbits(bits, axis=1)
+    width_bytes = packed.shape[1]
+    commands = bytearray()
+    for top in range(0, height, BAND_HEIGHT):
+        band = packed[top:top + BAND_HEIGHT]
+        rows = band.shape[0]
+        commands += b"\x1D\x76\x30\x00"
+        commands += bytes([width_bytes & 0xFF, width_bytes >> 8, rows & 0xFF, rows >> 8])
+        commands += band.tobytes()
+    return bytes(commands)
+
+
+class RasterImageCache:
+    """Packed raster bytes per (image content, paper width), cached in memory and on disk.
+
+    Converting a logo happens once; afterwards printing it is only a byte copy.
+    """
+
+    def __init__(self, cache_dir='image_cache'):
+        self.cache_dir = cache_dir
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, width):
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except OSError as e:
+            raise ImageError(f"Cannot read image '{path}': {str(e)}")
+        key = f"{hashlib.sha256(content).hexdigest()}-{width}"
+        with self._lock:
+            raster = self._memory.get(key)
+        if raster is not None:
+            return raster
+
+        cache_path = os.path.join(self.cache_dir, key + '.bin')
+        try:
+            with open(cache_path, 'rb') as f:
+                raster = f.read()
+        except OSError:
+            raster = self._convert(path, content, width)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = cache_path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(raster)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logging.warning(f"Cannot write image cache '{cache_path}': {str(e)}")
+        with self._lock:
+            self._memory[key] = raster
+        return raster
+
+    @staticmethod
+    def _convert(path, content, width):
+        try:
+            from io import BytesIO
+            from PIL import Image
+        except ImportError:
+            raise ImageError("Printing images requires Pillow and numpy (pip install Pillow numpy)")
+        try:
+            image = Image.open(BytesIO(content))
+            image.load()
+        except Exception as e:
+            raise ImageError(f"Cannot open image '{path}': {str(e)}")
+        return pack_raster(dither(image, width))
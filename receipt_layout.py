@@ -0,0 +1,345 @@
+import copy
+import unicodedata
+
+from escpos import FONT_DOTS, PAPER_DOTS
+from render_plan import ITEM_FIELDS, TemplateError
+
+ALIGNS = {'left': '<', 'right': '>', 'center': '^'}  # Align option -> format spec fill direction
+OVERFLOWS = ('truncate', 'wrap')
+ELLIPSIS = '...'
+FILL = '*'  # Column width taking the room the other columns leave
+
+_widths = None  # Columns taken by each BMP character, built on the first non-ASCII text
+_wide_widths = {}  # Same for characters outside the BMP, filled as they show up
+
+
+def _build_widths():
+    widths = bytearray(b'\x01') * 0x10000
+    for code in range(0x80, 0x10000):
+        char = chr(code)
+        if unicodedata.category(char) in ('Mn', 'Me', 'Cf', 'Cc'):
+            # Combining marks and invisible format characters take no column
+            widths[code] = 0
+        elif unicodedata.east_asian_width(char) in ('W', 'F'):
+            widths[code] = 2
+    return bytes(widths)
+
+
+def char_width(char):
+    global _widths
+    code = ord(char)
+    if code < 0x80:
+        return 1
+    if code < 0x10000:
+        if _widths is None:
+            _widths = _build_widths()
+        return _widths[code]
+    width = _wide_widths.get(code)
+    if width is None:
+        width = _wide_widths[code] = 0 if unicodedata.category(char) in ('Mn', 'Me', 'Cf') \
+            else 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+    return width
+
+
+def normalize(text):
+    """Compose combining sequences (e.g. ``e`` + U+0301 into ``é``) so they print as one character."""
+    return text if text.isascii() else unicodedata.normalize('NFC', text)
+
+
+def text_width(text):
+    """Columns ``text`` takes on the printer; wide characters take two, combining marks none."""
+    if text.isascii():
+        return len(text)
+    return sum(char_width(char) for char in text)
+
+
+def truncate(text, width):
+    """Cut ``text`` to at most ``width`` columns, ending with ``...`` when there is room for it."""
+    if text.isascii():
+        # One column per character, the common case for product names
+        if len(text) <= width:
+            return text
+        return text[:width - len(ELLIPSIS)] + ELLIPSIS if width > len(ELLIPSIS) else text[:width]
+    if text_width(text) <= width:
+        return text
+    if width <= len(ELLIPSIS):
+        return _take(text, width)[0]
+    return _take(text, width - len(ELLIPSIS))[0] + ELLIPSIS
+
+
+def _take(text, width):
+    """Split ``text`` after at most ``width`` columns; returns ``(head, rest)``."""
+    if text.isascii():
+        return text[:width], text[width:]
+    used = 0
+    for index, char in enumerate(text):
+        char_columns = char_width(char)
+        if used + char_columns > width:
+            return text[:index], text[index:]
+        used += char_columns
+    return text, ''
+
+
+def wrap(text, width):
+    """Break ``text`` into lines of at most ``width`` columns, at spaces where possible."""
+    if text.isascii():
+        return _wrap_ascii(text, width)
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        line_width = 0
+        for word in paragraph.split(' '):
+            word_width = text_width(word)
+            if not line:
+                candidate_width = word_width
+            else:
+                candidate_width = line_width + 1 + word_width
+            if candidate_width <= width:
+                line = f"{line} {word}" if line else word
+                line_width = candidate_width
+                continue
+            if line:
+                lines.append(line)
+            # Words longer than a line are split wherever the line ends
+            parts = split_columns(word, width)
+            lines.extend(parts[:-1])
+            line = parts[-1]
+            line_width = text_width(line)
+        lines.append(line)
+    return lines
+
+
+def _wrap_ascii(text, width):
+    """``wrap`` for ASCII text, where every character is one column."""
+    lines = []
+    for paragraph in text.split('\n'):
+        while len(paragraph) > width:
+            cut = paragraph.rfind(' ', 0, width + 1)
+            if cut <= 0:
+                lines.append(paragraph[:width])
+                paragraph = paragraph[width:]
+            else:
+                lines.append(paragraph[:cut])
+                paragraph = paragraph[cut + 1:]
+        lines.append(paragraph)
+    return lines
+
+
+def split_columns(text, width):
+    """Cut ``text`` every ``width`` columns, the way the printer wraps a line that is too long."""
+    parts = []
+    while text_width(text) > width:
+        head, text = _take(text, width)
+        if not head:
+            # A wide character on a one-column line
+            head, text = text[:1], text[1:]
+        parts.append(head)
+    parts.append(text)
+    return parts
+
+
+def pad(text, width, align='left'):
+    """Fill ``text`` with spaces to exactly ``width`` columns (``text`` must fit)."""
+    space = width - text_width(text)
+    if space <= 0:
+        return text
+    if align == 'right':
+        return ' ' * space + text
+    if align == 'center':
+        return ' ' * (space // 2) + text + ' ' * (space - space // 2)
+    return text + ' ' * space
+
+
+class PrinterProfile:
+    """Printable width of a paper size with one printer font.
+
+    58mm printers print 384 dots and 80mm printers 576; font A is 12 dots
+    wide and font B 9, which gives 32/42 columns on 58mm and 48/64 on 80mm.
+    ``dots`` overrides the printable width, e.g. for 80mm printers with 512
+    dots, and is needed for any other paper size.
+    """
+
+    def __init__(self, paper_size, font='A', dots=None):
+        if font not in FONT_DOTS:
+            raise TemplateError(f"font: unknown font '{font}' (supported: {', '.join(FONT_DOTS)})")
+        if not isinstance(paper_size, str) or not (dots or paper_size in PAPER_DOTS):
+            raise TemplateError(f"paper_size: unknown paper size '{paper_size}' (supported: {', '.join(PAPER_DOTS)})")
+        self.paper_size = paper_size
+        self.font = font
+        self.dots = dots or PAPER_DOTS[paper_size]
+        self.columns = self.dots // FONT_DOTS[font]
+        self.key = (paper_size, font, self.dots)
+
+    def __repr__(self):
+        return f"PrinterProfile({self.paper_size!r}, {self.font!r}, {self.columns} columns)"
+
+
+class ItemColumn:
+    """One column of an item line: a field or fixed text at a resolved width."""
+
+    def __init__(self, spec, section):
+        if not isinstance(spec, dict):
+            raise TemplateError(f"{section}: must be an object")
+        unknown = set(spec) - {'field', 'text', 'width', 'align', 'overflow'}
+        if unknown:
+            raise TemplateError(f"{section}: unknown option(s) {', '.join(sorted(unknown))}")
+        self.field = spec.get('field')
+        self.text = spec.get('text')
+        if (self.field is None) == (self.text is None):
+            raise TemplateError(f"{section}: needs either 'field' or 'text'")
+        if self.field is not None and (not isinstance(self.field, str) or not self.field.isidentifier()):
+            raise TemplateError(f"{section}: invalid field name {self.field!r}")
+        if self.text is not None and not isinstance(self.text, str):
+            raise TemplateError(f"{section}: 'text' must be a string")
+        self.align = spec.get('align', 'left')
+        if self.align not in ALIGNS:
+            raise TemplateError(f"{section}: unknown align '{self.align}' (supported: {', '.join(ALIGNS)})")
+        self.overflow = spec.get('overflow', 'truncate')
+        if self.overflow not in OVERFLOWS:
+            raise TemplateError(f"{section}: unknown overflow '{self.overflow}' (supported: {', '.join(OVERFLOWS)})")
+        # Text columns are as wide as their text, field columns fill the line by default
+        default_width = text_width(normalize(self.text)) if self.text is not None else FILL
+        self.width = spec.get('width', default_width)
+        if self.width != FILL and (not isinstance(self.width, int) or isinstance(self.width, bool)
+                                   or self.width < 1):
+            raise TemplateError(f"{section}: width must be a positive number of columns or '{FILL}'")
+        self.blank = None
+
+    def resolve(self, width):
+        self.width = width
+        self.blank = ' ' * width
+        if self.text is not None:
+            self.text = pad(truncate(normalize(self.text), width), width, self.align)
+
+    def fit(self, value):
+        """The value as lines of exactly ``width`` columns; more than one only with ``overflow: wrap``."""
+        if self.text is not None:
+            return [self.text]
+        text = value if isinstance(value, str) else str(value)
+        width = self.width
+        if text.isascii() and '\n' not in text:
+            # Every ASCII character is one column, str methods measure it right
+            if len(text) <= width:
+                return [format(text, f'{ALIGNS[self.align]}{width}')]
+            if self.overflow == 'truncate':
+                return [text[:width - len(ELLIPSIS)] + ELLIPSIS if width > len(ELLIPSIS) else text[:width]]
+        if self.overflow == 'wrap' and text.isascii():
+            spec = f'{ALIGNS[self.align]}{width}'
+            return [format(line, spec) for line in _wrap_ascii(text, width)]
+        text = normalize(text)
+        if self.overflow == 'wrap':
+            return [pad(line, width, self.align) for line in wrap(text, width)]
+        return [pad(truncate(text.replace('\n', ' '), width), width, self.align)]
+
+
+class ItemLayout:
+    """Declarative item columns resolved once for a ``PrinterProfile``.
+
+    ``columns`` is a list of rows, each a list of columns separated by one
+    space (a flat list of columns is a single row)::
+
+        [[{"field": "nama_produk", "overflow": "wrap"}],
+         [{"field": "qty", "width": 3, "align": "right"}, {"field": "satuan", "width": 3},
+          {"text": "x"}, {"field": "harga", "width": 9, "align": "right"},
+          {"text": "="}, {"field": "total_harga", "width": "*", "align": "right"}]]
+
+    Widths are in printer columns; ``"*"`` columns share the room left on
+    the line. ``overflow`` is ``truncate`` (default) or ``wrap`` onto extra
+    lines. Fields other than the standard item fields must be listed in
+    ``custom_fields`` (the template ``item_fields``) and are read from the
+    item as-is, like custom fields in ``item_format``.
+    """
+
+    def __init__(self, columns, profile, custom_fields=()):
+        if not isinstance(columns, list) or not columns:
+            raise TemplateError("item_columns: must be a non-empty list of columns or of rows")
+        rows = columns if all(isinstance(row, list) for row in columns) else [columns]
+        self.columns = copy.deepcopy(columns)  # Compared by compile_item_layout to reuse this layout
+        self.profile = profile
+        self.custom_fields = tuple(custom_fields)
+        self.rows = [self._resolve_row(row, index + 1) for index, row in enumerate(rows)]
+        self.field_names = [column.field for row in self.rows for column in row if column.field]
+        self.extra_fields = [name for name in dict.fromkeys(self.field_names) if name not in ITEM_FIELDS]
+        for name in self.extra_fields:
+            if name not in self.custom_fields:
+                raise TemplateError(f"item_columns: unknown field '{name}' (allowed: {', '.join(sorted(ITEM_FIELDS))}, "
+                                    f"declare custom item fields in item_fields)")
+        self.render = self._build_renderer()
+
+    def _resolve_row(self, row, number):
+        section = f"item_columns row {number}"
+        if not row:
+            raise TemplateError(f"{section}: has no columns")
+        row = [ItemColumn(spec, f"{section} column {index + 1}") for index, spec in enumerate(row)]
+        fills = [column for column in row if column.width == FILL]
+        used = sum(column.width for column in row if column.width != FILL) + len(row) - 1
+        room = self.profile.columns - used
+        if room < len(fills) or (not fills and room < 0):
+            raise TemplateError(f"{section}: needs {used + len(fills)} columns, "
+                                f"{self.profile.paper_size} font {self.profile.font} has {self.profile.columns}")
+        for index, column in enumerate(fills):
+            # Spread the room, the first columns get the remainder
+            column.resolve(room // len(fills) + (1 if index < room % len(fills) else 0))
+        for column in row:
+            if column.blank is None:
+                column.resolve(column.width)
+        return row
+
+    def _build_renderer(self):
+        """Compile the rows into one function with an f-string per row.
+
+        A row whose values are all ASCII text without line breaks that fits
+        its columns is formatted by its f-string; any other row goes through
+        ``render_row``, which measures, wraps and truncates.
+        """
+        assignments = []
+        body = []
+        for index, row in enumerate(self.rows):
+            checks = []
+            parts = []
+            for column in row:
+                if column.field is None:
+                    parts.append(_escape(column.text))
+                    continue
+                name = f"v{len(assignments)}"
+                assignments.append(f"    {name} = values[{column.field!r}]\n"
+                                   f"    {name} = {name} if {name}.__class__ is str else str({name})\n")
+                checks.append(f"{name}.isascii() and len({name}) <= {column.width} and '\\n' not in {name}")
+                parts.append(f"{{{name}:{ALIGNS[column.align]}{column.width}}}")
+            body.append(f"    if {' and '.join(checks) or 'True'}:\n"
+                        f"        lines.append(f{' '.join(parts)!r}.rstrip())\n"
+                        f"    else:\n"
+                        f"        lines.extend(render_row(rows[{index}], values))\n")
+        source = f"def render(values):\n{''.join(assignments)}    lines = []\n{''.join(body)}    return lines\n"
+        namespace = {'render_row': self.render_row, 'rows': self.rows}
+        exec(source, namespace)
+        return namespace['render']
+
+    @staticmethod
+    def render_row(row, values):
+        if len(row) == 1:
+            column = row[0]
+            return [line.rstrip() for line in column.fit(values[column.field] if column.field else None)]
+        cells = [column.fit(values[column.field] if column.field else None) for column in row]
+        height = max(len(cell) for cell in cells)
+        if height == 1:
+            return [' '.join(cell[0] for cell in cells).rstrip()]
+        return [' '.join(cell[line] if line < len(cell) else column.blank for column, cell in zip(row, cells)).rstrip()
+                for line in range(height)]
+
+
+def _escape(literal):
+    return literal.replace('{', '{{').replace('}', '}}')
+
+
+def compile_item_layout(columns, profile, previous=None, custom_fields=()):
+    """Resolve ``item_columns`` for ``profile``, or ``None`` when the template uses ``item_format``.
+
+    A ``previous`` layout with the same columns, profile and custom fields is reused as-is.
+    """
+    if columns is None:
+        return None
+    if previous is not None and previous.profile.key == profile.key and previous.columns == columns \
+            and previous.custom_fields == tuple(custom_fields):
+        return previous
+    return ItemLayout(columns, profile, custom_fields)
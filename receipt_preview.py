@@ -0,0 +1,111 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from receipt_image import ImageError
+from receipt_layout import char_width, normalize, split_columns
+
+# Monospace fonts tried in order for PNG previews; Pillow's built-in font is the fallback
+PREVIEW_FONTS = ('DejaVuSansMono.ttf', 'consola.ttf', 'cour.ttf', 'LiberationMono-Regular.ttf')
+LINE_SPACING = 1.1  # Line height as a multiple of the character height
+MARGIN = 8  # White border in dots around the PNG preview
+
+PREVIEW_TYPES = {'text': 'text/plain; charset=utf-8', 'png': 'image/png'}
+
+
+def preview_key(template_key, data, preview_format):
+    """Content hash of one preview.
+
+    ``template_key`` identifies the template: ``[name, version]`` of a saved
+    snapshot, or the settings of an unsaved one.
+    """
+    content = json.dumps([template_key, preview_format, data],
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class PreviewCache:
+    """LRU cache of rendered previews keyed by content hash, bounded by total byte size."""
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, old_body = self._entries.popitem(last=False)
+                self._bytes -= len(old_body)
+
+
+def _load_font(size):
+    from PIL import ImageFont
+
+    for name in PREVIEW_FONTS:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def render_png(text, profile):
+    """Draw a text receipt as a PNG at the printer's dot width.
+
+    Every column gets a fixed cell of the printer font's width, wide
+    characters two, so lines wrap and line up the same way they do on paper.
+    """
+    try:
+        from io import BytesIO
+        from PIL import Image, ImageDraw
+    except ImportError:
+        raise ImageError("PNG previews require Pillow (pip install Pillow)")
+
+    columns = profile.columns
+    cell_width = max(1, profile.dots // columns)
+    cell_height = cell_width * 2  # Both fonts are about twice as tall as they are wide
+    line_height = round(cell_height * LINE_SPACING)
+    font = _load_font(cell_height - 4)
+
+    lines = []
+    for line in text.split('\n'):
+        # Text past the paper width continues on the next line, like on the printer
+        lines.extend(split_columns(normalize(line), columns))
+    if lines and lines[-1] == '':
+        lines.pop()
+
+    image = Image.new('L', (profile.dots + 2 * MARGIN, len(lines) * line_height + 2 * MARGIN), 255)
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        top = MARGIN + row * line_height
+        column = 0
+        for char in line:
+            width = char_width(char)
+            if char != ' ' and width:
+                draw.text((MARGIN + column * cell_width, top), char, fill=0, font=font)
+            column += width
+    output = BytesIO()
+    image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+def render_preview(template, data, preview_format='text'):
+    """Render ``data`` with a ``CompiledTemplate`` as text or PNG bytes."""
+    text = template.generate_receipt(data)
+    if preview_format == 'png':
+        return render_png(text, template.profile)
+    return text.encode('utf-8')
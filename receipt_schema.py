@@ -0,0 +1,170 @@
+import json
+import math
+
+MAX_ITEMS = 1000
+MAX_ERRORS = 20  # Stop collecting once this many fields are wrong
+
+
+class ReceiptDataError(ValueError):
+    """Invalid receipt data; ``errors`` lists ``{"field": ..., "message": ...}`` entries."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+class _Invalid(Exception):
+    pass
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise _Invalid("must be a string")
+
+
+def _number(value):
+    """Integer quantities stay ints, so '{qty:>3}' prints '2' and not '2.0'."""
+    if value.__class__ is int:
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number = value
+    elif isinstance(value, str):
+        try:
+            number = int(value)
+        except ValueError:
+            try:
+                number = float(value)
+            except ValueError:
+                raise _Invalid("must be a number")
+    else:
+        raise _Invalid("must be a number")
+    if not math.isfinite(number):
+        raise _Invalid("must be a finite number")
+    return number
+
+
+def _amount(value):
+    if value.__class__ is float and value - value == 0:
+        # Already a finite float, the usual case for JSON amounts; NaN and infinity fail the subtraction
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise _Invalid("must be a number")
+    try:
+        amount = float(value)
+    except ValueError:
+        raise _Invalid("must be a number")
+    if not math.isfinite(amount):
+        raise _Invalid("must be a finite number")
+    return amount
+
+
+# (field, coerce, required) -- checked in this order
+RECEIPT_SCHEMA = (
+    ('nama_toko', _text, True),
+    ('alamat_toko', _text, False),
+    ('no_hp', _text, False),
+    ('nama_kasir', _text, False),
+    ('code', _text, False),
+    ('tanggal', _text, False),
+    ('notes', _text, False)
+)
+
+ITEM_SCHEMA = (
+    ('nama_produk', _text, True),
+    ('qty', _number, True),
+    ('satuan', _text, False),
+    ('harga', _amount, True),
+    ('diskon', _amount, True),
+    ('total_harga', _amount, True)
+)
+
+RECEIPT_FIELDS = tuple(name for name, _, _ in RECEIPT_SCHEMA)
+
+
+class ReceiptValidator:
+    """Validates and coerces one receipt in a single pass over its fields and items.
+
+    Receipt fields missing from the payload are left out, so the template
+    prints its defaults (no footer without ``notes``, the current time
+    without ``tanggal``); fields sent empty stay empty. Items are
+    coerced in place (amounts become floats, ``satuan`` defaults to ``''``)
+    and fields the schema does not know are kept for custom item formats.
+    """
+
+    def __init__(self, max_items=MAX_ITEMS, max_errors=MAX_ERRORS):
+        self.max_items = max_items
+        self.max_errors = max_errors
+
+    def validate_fields(self, fields):
+        """Coerce the top-level receipt fields; returns ``(data, errors)``."""
+        data = {}
+        errors = []
+        for name, coerce, required in RECEIPT_SCHEMA:
+            value = fields.get(name)
+            if value is None or value == '':
+                if required:
+                    errors.append({'field': name, 'message': "is required"})
+                elif value == '':
+                    data[name] = value
+                continue
+            try:
+                data[name] = coerce(value)
+            except _Invalid as e:
+                errors.append({'field': name, 'message': str(e)})
+        return data, errors
+
+    def validate_items(self, items, errors):
+        if isinstance(items, (str, bytes)):
+            try:
+                items = json.loads(items)
+            except ValueError as e:
+                errors.append({'field': 'items', 'message': f"invalid JSON: {str(e)}"})
+                return []
+        if not isinstance(items, list):
+            errors.append({'field': 'items', 'message': "must be a JSON array"})
+            return []
+        if len(items) > self.max_items:
+            errors.append({'field': 'items', 'message': f"too many items ({len(items)}, at most {self.max_items})"})
+            return []
+
+        for index, item in enumerate(items):
+            self._validate_item(index, item, errors)
+            if len(errors) >= self.max_errors:
+                break
+        return items
+
+    @staticmethod
+    def _validate_item(index, item, errors):
+        if not isinstance(item, dict):
+            errors.append({'field': f'items[{index}]', 'message': "must be an object"})
+            return
+        for name, coerce, required in ITEM_SCHEMA:
+            value = item.get(name)
+            if value is None:
+                if required:
+                    errors.append({'field': f'items[{index}].{name}', 'message': "is required"})
+                else:
+                    item[name] = ''
+                continue
+            try:
+                item[name] = coerce(value)
+            except _Invalid as e:
+                errors.append({'field': f'items[{index}].{name}', 'message': str(e)})
+
+    def validate(self, fields):
+        """Return the receipt data for a form or JSON object, or raise ``ReceiptDataError``."""
+        data, errors = self.validate_fields(fields)
+        data['items'] = self.validate_items(fields.get('items', '[]'), errors)
+        if errors:
+            raise validation_error(errors[:self.max_errors])
+        return data
+
+
+def validation_error(errors):
+    message = '; '.join(f"{error['field']}: {error['message']}" for error in errors[:3])
+    if len(errors) > 3:
+        message += f" (and {len(errors) - 3} more)"
+    return ReceiptDataError(message, errors)
@@ -1,251 +1,1035 @@
+import glob
+import itertools
 import json
+import os
+import re
 from datetime import datetime
+import threading
+import time
+from types import MappingProxyType
 from flask import Flask, request, jsonify
-import win32print
-import win32con
 import logging
-import locale
+from print_queue import PrintQueue, QueueFullError
+from printer_transport import create_transport, win32print
+from printer_registry import PrinterRegistry
+from printer_pool import PrinterRouter, RoutingError
+from printer_status import PrinterStatusMonitor
+from render_plan import compile_template, compile_styles, compile_codepage, TemplateError
+from escpos import EscPosDocument, TextLines
+from receipt_image import RasterImageCache, ImageError
+from receipt_layout import PrinterProfile, compile_item_layout, normalize, truncate, wrap
+from rupiah import format_rupiah
+from job_journal import JobJournal
+from receipt_cache import ReceiptCache, RecentSubmissions
+from receipt_schema import ReceiptValidator, ReceiptDataError, validation_error, MAX_ITEMS
+from receipt_preview import PreviewCache, PREVIEW_TYPES, preview_key, render_preview
+from metrics import metrics
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Set the locale to Indonesian
-locale.setlocale(locale.LC_ALL, 'id_ID.UTF-8')
+def load_config():
+    try:
+        with open('mosys.json', 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
-def format_rupiah(amount):
-    # Bulatkan ke bilangan bulat terdekat
-    rounded_amount = round(amount)
-    # Format sebagai mata uang tanpa simbol dan tanpa desimal
-    formatted = locale.currency(rounded_amount, grouping=True, symbol='')
-    # Hilangkan koma dan dua angka di belakangnya
-    return formatted.split(',')[0]
+DEFAULT_TEMPLATE = {
+    'paper_size': '80mm',
+    'font_size': 12,
+    'header_format': '{nama_toko}\n{alamat_toko}\nTelp: {no_hp}',
+    'cashier_format': 'Kasir: {nama_kasir}',
+    'code_format': 'No : {code}',
+    'date_format': 'Tanggal: {tanggal}',
+    'item_format': '{nama_produk:<20} {qty:>3} {satuan:<3} x {harga:>12} - {diskon:>8} = {total_harga:>12}',
+    'summary_format': 'Total Item: {total_item}\nTotal Diskon: {total_diskon}\nTotal Harga: {total_harga}',
+    'footer_format': 'Notes: {notes}',
+    'codepage': 'cp437',
+    'font': 'A',
+    'item_columns': None,
+    'item_fields': [],
+    'styles': {},
+    'header_image': None,
+    'footer_image': None
+}
 
-class ReceiptTemplate:
-    def __init__(self):
-        self.template = {
-            'paper_size': '80mm',
-            'font_size': 12,
-            'header_format': '{nama_toko}\n{alamat_toko}\nTelp: {no_hp}',
-            'cashier_format': 'Kasir: {nama_kasir}',
-            'code_format': 'No : {code}',
-            'date_format': 'Tanggal: {tanggal}',
-            'item_format': '{nama_produk:<20} {qty:>3} {satuan:<3} x {harga:>12} - {diskon:>8} = {total_harga:>12}',
-            'summary_format': 'Total Item: {total_item}\nTotal Diskon: {total_diskon}\nTotal Harga: {total_harga}',
-            'footer_format': 'Notes: {notes}'
-        }
-        self.load_template()
-
-    def load_template(self):
-        try:
-            with open('receipt_template.json', 'r') as f:
-                saved_template = json.load(f)
-                self.template.update(saved_template)
-        except FileNotFoundError:
-            self.save_template()
+IMAGE_SECTIONS = ('header_image', 'footer_image')
+
+DEFAULT_TEMPLATE_NAME = 'default'
+TEMPLATE_FILE = 'receipt_template.json'
+TEMPLATE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+STREAM_CHUNK_SIZE = 8 * 1024  # Bytes per chunk when a receipt is streamed to the printer
+STREAM_MIN_ITEMS = 200  # /print receipts with at least this many items are rendered while printing
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
-    def save_template(self):
-        with open('receipt_template.json', 'w') as f:
-            json.dump(self.template, f, indent=2)
+def write_json_atomic(path, data):
+    """Write ``data`` to a temporary file and rename it over ``path``, so readers never see a partial file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
-    def update_template(self, **kwargs):
-        self.template.update(kwargs)
-        self.save_template()
+class CompiledTemplate:
+    """Compiled, read-only snapshot of one named template.
+
+    Changing a template builds a new snapshot instead of modifying this one,
+    so a receipt always renders with a single consistent template.
+    """
+
+    def __init__(self, name, version, template, plan, styles, codepage, images, profile, layout=None):
+        self.name = name
+        self.version = version
+        self.template = MappingProxyType(template)
+        self.plan = plan
+        self.styles = styles
+        self.codepage = codepage
+        self.images = images
+        self.profile = profile
+        self.layout = layout  # ItemLayout of the item_columns, None for item_format
+        self.paper_width = profile.columns
+        self.loaded_at = time.time()
 
     def get_paper_width(self):
-        return 48 if self.template['paper_size'] == '58mm' else 48
-        
+        return self.paper_width
+
     def truncate_product_name(self, name, max_length=10):
-        if len(name) > max_length:
-            return name[:max_length-3] + '...'
-        return name
+        return truncate(normalize(name), max_length)
+
+    def item_field_errors(self, items):
+        """Validation errors for custom item fields the item lines print that are missing or do not fit."""
+        layout = self.layout
+        item_plan = self.plan['item_format']
+        extra_fields = layout.extra_fields if layout else item_plan.extra_fields
+        errors = []
+        if not extra_fields:
+            return errors
+        for index, item in enumerate(items):
+            missing = [name for name in extra_fields if name not in item]
+            errors.extend({'field': f'items[{index}].{name}', 'message': "required by the template"}
+                          for name in missing)
+            if not layout and not missing:
+                # Item columns print any value, format specs need a value of the right type
+                errors.extend({'field': f'items[{index}].{name}', 'message': message}
+                              for name, message in item_plan.custom_field_errors(item))
+        return errors
 
     def generate_receipt(self, data):
-        receipt = []
-        paper_width = self.get_paper_width()  # Menggunakan metode yang sudah ada untuk mendapatkan lebar kertas
+        """Render a receipt as plain text."""
+        return self.render(data, TextLines()).getvalue()
+
+    def render_document(self, data):
+        """Render a receipt straight into a complete ESC/POS document."""
+        document = EscPosDocument(self.codepage, font=self.profile.font).begin()
+        return self.render(data, document).end().getvalue()
+
+    def iter_document(self, data, chunk_size=STREAM_CHUNK_SIZE):
+        """Render a receipt into ESC/POS bytes, yielded in chunks of about ``chunk_size`` bytes.
+
+        Chunks are yielded while the items are still being rendered and the
+        buffer is reused, so memory stays the same however long the receipt
+        is. Joining the chunks gives the same bytes as ``render_document``.
+        """
+        document = EscPosDocument(self.codepage, capacity=chunk_size * 2, font=self.profile.font).begin()
+        for _ in self.render_steps(data, document):
+            if len(document) >= chunk_size:
+                yield document.take()
+        yield document.end().take()
+
+    def render(self, data, receipt):
+        """Write the receipt lines for ``data`` to ``receipt`` (an ``EscPosDocument`` or ``TextLines``)."""
+        for _ in self.render_steps(data, receipt):
+            pass
+        return receipt
+
+    def render_steps(self, data, receipt):
+        """Generator behind ``render``; it yields after the header and after every item line."""
+        plan = self.plan
+        styles = self.styles
+        images = self.images
+        paper_width = self.paper_width
 
         # Header
-        receipt.append(self.template['header_format'].format(
-            nama_toko=data.get('nama_toko', ''),
-            alamat_toko=data.get('alamat_toko', ''),
-            no_hp=data.get('no_hp', '')
-        ))
+        if 'header_image' in images:
+            receipt.raw(images['header_image'])
+        receipt.line(plan['header_format'].render({
+            'nama_toko': data.get('nama_toko', ''),
+            'alamat_toko': data.get('alamat_toko', ''),
+            'no_hp': data.get('no_hp', '')
+        }), styles['header'])
 
         # Cashier and Date
-        receipt.append(self.template['cashier_format'].format(nama_kasir=data.get('nama_kasir', '')))
-        receipt.append(self.template['code_format'].format(code=data.get('code', '')))
-        receipt.append(self.template['date_format'].format(tanggal=data.get('tanggal', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
+        receipt.line(plan['cashier_format'].render({'nama_kasir': data.get('nama_kasir', '')}), styles['cashier'])
+        receipt.line(plan['code_format'].render({'code': data.get('code', '')}), styles['code'])
+        receipt.line(plan['date_format'].render({'tanggal': data.get('tanggal', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}), styles['date'])
+        yield
 
-        # Items
-        receipt.append('-' * paper_width)
-        max_product_name_length = 20 if paper_width == 32 else 30  # Lebih panjang untuk kertas 80mm
+        # Items, totals are accumulated in the same pass
+        receipt.line('-' * paper_width, styles['separator'])
+        max_product_name_length = 20 if paper_width < 48 else 30  # Lebih panjang untuk kertas 80mm
+        layout = self.layout
+        item_plan = plan['item_format']
+        extra_fields = layout.extra_fields if layout else item_plan.extra_fields
+        item_style = styles['item']
+        # Bound once, the loop below runs for every item of every receipt
+        line = receipt.line
+        render_item = layout.render if layout else item_plan.render
+        rupiah = format_rupiah
+        total_item = 0
+        total_diskon = 0
+        total_harga = 0
         for item in data.get('items', []):
-            formatted_item = item.copy()
-            formatted_item['nama_produk'] = self.truncate_product_name(item['nama_produk'], max_product_name_length)
-            formatted_item['harga'] = format_rupiah(item['harga'])
-            formatted_item['diskon'] = format_rupiah(item['diskon'])
-            formatted_item['total_harga'] = format_rupiah(item['total_harga'])
-            
-            if paper_width == 32:  # 58mm paper
-                item_line1 = f"{formatted_item['nama_produk']}"
-                item_line2 = f"{formatted_item['qty']:>2} {formatted_item['satuan']:<2} x{formatted_item['harga']:>8}"
-                item_line3 = f"-{formatted_item['diskon']:>7} ={formatted_item['total_harga']:>9}"
-                
-                receipt.append(item_line1)
-                receipt.append(item_line2)
-                receipt.append(item_line3)
-            else:  # 80mm paper
-                item_line = self.template['item_format'].format(**formatted_item)
-                receipt.append(item_line)
-        
-        receipt.append('-' * paper_width)
+            qty = item['qty']
+            diskon = item['diskon']
+            item_total = item['total_harga']
+            total_item += qty
+            total_diskon += diskon
+            total_harga += item_total
+
+            name = item['nama_produk']
+            if not layout and (len(name) > max_product_name_length or not name.isascii()):
+                # Item columns fit the name themselves
+                name = truncate(normalize(name), max_product_name_length)
+            values = {
+                'nama_produk': name,
+                'qty': qty,
+                'satuan': item.get('satuan', ''),
+                'harga': rupiah(item['harga']),
+                'diskon': rupiah(diskon),
+                'total_harga': rupiah(item_total)
+            }
+            if extra_fields:
+                # Custom item fields used by the template are taken from the item as-is
+                for name in extra_fields:
+                    values[name] = item[name]
+
+            if layout:
+                for item_line in render_item(values):
+                    line(item_line, item_style)
+            else:
+                line(render_item(values), item_style)
+            yield
+
+        receipt.line('-' * paper_width, styles['separator'])
 
         # Summary
-        total_item = sum(item['qty'] for item in data.get('items', []))
-        total_diskon = sum(item['diskon'] for item in data.get('items', []))
-        total_harga = sum(item['total_harga'] for item in data.get('items', []))
-        
-        summary = self.template['summary_format'].format(
-            total_item=total_item,
-            total_diskon=format_rupiah(total_diskon),
-            total_harga=format_rupiah(total_harga)
-        )
-        receipt.extend(summary.split('\n'))
+        summary = plan['summary_format'].render({
+            'total_item': total_item,
+            'total_diskon': format_rupiah(total_diskon),
+            'total_harga': format_rupiah(total_harga)
+        })
+        receipt.line(summary, styles['summary'])
 
         # Footer
         if 'notes' in data:
-            footer = self.template['footer_format'].format(notes=data['notes'])
-            # Wrap long notes
-            wrapped_footer = [footer[i:i+paper_width] for i in range(0, len(footer), paper_width)]
-            receipt.extend(wrapped_footer)
+            footer = plan['footer_format'].render({'notes': data['notes']})
+            # Wrap long notes at word boundaries, measured in printer columns
+            for footer_line in wrap(normalize(footer), paper_width):
+                receipt.line(footer_line, styles['footer'])
+        if 'footer_image' in images:
+            receipt.raw(images['footer_image'])
+
+class StreamedReceipt:
+    """A validated receipt queued as data and rendered in chunks while it prints.
+
+    Long receipts are queued this way, so the printer gets the first bytes
+    without waiting for the whole document. Iterating renders it again,
+    which is what a retry or a failover to another printer needs; ``size``
+    is the length of the last complete rendering.
+    """
+
+    def __init__(self, template, data):
+        self.template = template
+        self.data = data
+        self.size = 0
+
+    def __iter__(self):
+        size = 0
+        for chunk in self.template.iter_document(self.data):
+            size += len(chunk)
+            yield chunk
+        self.size = size
+
+    def to_dict(self):
+        """The receipt as journaled and cached for reprint; ``restore_receipt`` reverses it."""
+        return {'template': self.template.name, 'data': self.data}
+
+
+class ReceiptTemplate:
+    """Store of named receipt templates, each held as a ``CompiledTemplate``.
+
+    The ``default`` template lives in receipt_template.json and every other
+    template in ``template_dir/<name>.json``. Saving a template compiles it,
+    writes the file atomically and then swaps the new snapshot in with one
+    assignment; prints that already picked up the old snapshot finish with
+    it. ``start_watching()`` reloads templates whose file changes on disk.
+    """
+
+    def __init__(self, template_dir='templates', paper_dots=None):
+        self.template_dir = template_dir
+        self.paper_dots = paper_dots or {}  # Printable dots per paper size where printers differ from the usual
+        self.image_cache = RasterImageCache()
+        self.templates = {}
+        self._versions = itertools.count(1)
+        self._write_lock = threading.Lock()
+        self._stamps = {}
+        self._watcher = None
+        self.load_templates()
+
+    @property
+    def template(self):
+        """The default template's settings."""
+        return self.get().template
+
+    def get(self, name=None):
+        try:
+            return self.templates[name or DEFAULT_TEMPLATE_NAME]
+        except KeyError:
+            raise TemplateError(f"Unknown template '{name}'")
+
+    def names(self):
+        return sorted(self.templates)
+
+    def path_for(self, name):
+        if name == DEFAULT_TEMPLATE_NAME:
+            return TEMPLATE_FILE
+        if not TEMPLATE_NAME_PATTERN.match(name or ''):
+            raise TemplateError(f"Invalid template name '{name}' (use letters, digits, '-' and '_')")
+        return os.path.join(self.template_dir, name + '.json')
+
+    def template_files(self):
+        files = {DEFAULT_TEMPLATE_NAME: TEMPLATE_FILE}
+        for path in glob.glob(os.path.join(self.template_dir, '*.json')):
+            name = os.path.basename(path)[:-len('.json')]
+            if name != DEFAULT_TEMPLATE_NAME and TEMPLATE_NAME_PATTERN.match(name):
+                files[name] = path
+        return files
+
+    def load_templates(self):
+        templates = {}
+        for name, path in self.template_files().items():
+            compiled = self.load_template(name, path)
+            if compiled is not None:
+                templates[name] = compiled
+        self.templates = templates
+
+    def load_template(self, name, path, fallback=True):
+        """Compile the template saved at ``path``, or return ``None`` if it cannot be used.
+
+        With ``fallback`` a broken default template is replaced by
+        ``DEFAULT_TEMPLATE`` so the server can always print; a reload passes
+        ``fallback=False`` to keep the last good snapshot instead.
+        """
+        template = dict(DEFAULT_TEMPLATE)
+        self._stamps[path] = file_stamp(path)
+        try:
+            with open(path, 'r') as f:
+                template.update(json.load(f))
+            return self.compile(name, template, strict=False)
+        except FileNotFoundError:
+            if name != DEFAULT_TEMPLATE_NAME or not fallback:
+                return None
+            self.save_template(path, template)
+            return self.compile(name, template)
+        except (OSError, ValueError) as e:
+            # ValueError covers invalid JSON as well as TemplateError
+            logging.error(f"Cannot load template '{name}' from {path}: {str(e)}")
+        if fallback and name == DEFAULT_TEMPLATE_NAME:
+            return self.compile(name, dict(DEFAULT_TEMPLATE))
+        return None
+
+    def compile(self, name, template, strict=True, images=True, previous=None):
+        """Compile ``template`` into a new snapshot.
+
+        ``images=False`` skips the logos, e.g. for text previews; format
+        plans and the item layout are reused from the ``previous`` snapshot
+        where unchanged.
+        """
+        plan = compile_template(template, previous.plan if previous else None)
+        styles = compile_styles(template.get('styles', {}))
+        codepage = compile_codepage(template.get('codepage', 'cp437'))
+        paper_size = template['paper_size']
+        dots = self.paper_dots.get(paper_size) if isinstance(paper_size, str) else None
+        profile = PrinterProfile(paper_size, template.get('font', 'A'), dots)
+        layout = compile_item_layout(template.get('item_columns'), profile, previous.layout if previous else None,
+                                     plan['item_format'].custom_fields)
+        images = self.compile_images(template, profile, strict) if images else {}
+        return CompiledTemplate(name, next(self._versions), template, plan, styles, codepage, images, profile, layout)
+
+    def compile_images(self, template, profile, strict=True):
+        """Load the header/footer images as packed raster bytes (cached by image hash and paper width).
+
+        A missing or unreadable image is an error when saving a template, but
+        only logged when loading one, so a moved logo does not block printing.
+        """
+        width = profile.dots
+        images = {}
+        for section in IMAGE_SECTIONS:
+            path = template.get(section)
+            if not path:
+                continue
+            try:
+                images[section] = self.image_cache.get(path, width)
+            except ImageError as e:
+                if strict:
+                    raise TemplateError(f"{section}: {str(e)}")
+                logging.error(f"Skipping {section}: {str(e)}")
+        return images
+
+    def save_template(self, path, template):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_json_atomic(path, template)
+        self._stamps[path] = file_stamp(path)
+
+    def update_template(self, name=DEFAULT_TEMPLATE_NAME, **kwargs):
+        """Change (or create) template ``name``; raises TemplateError before anything is saved if it is invalid."""
+        path = self.path_for(name)
+        with self._write_lock:
+            current = self.templates.get(name)
+            new_template = dict(current.template if current else DEFAULT_TEMPLATE, **kwargs)
+            compiled = self.compile(name, new_template)
+            self.save_template(path, new_template)
+            self.templates = dict(self.templates, **{name: compiled})
+        logging.info(f"Template '{name}' updated to version {compiled.version}")
+        return compiled
 
-        return '\n'.join(receipt)
+    def start_watching(self, interval=2):
+        """Poll the template files every ``interval`` seconds and reload the ones that changed."""
+        if self._watcher is None and interval:
+            self._watcher = threading.Thread(target=self._watch_loop, args=(interval,),
+                                             name="template-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload_changed()
+            except Exception as e:
+                logging.error(f"Error reloading templates: {str(e)}")
+
+    def reload_changed(self):
+        """Reload templates whose file was added, changed or removed; returns the changed names."""
+        changed = []
+        with self._write_lock:
+            templates = dict(self.templates)
+            files = self.template_files()
+            for name, path in files.items():
+                if file_stamp(path) == self._stamps.get(path):
+                    continue
+                # A broken or missing file keeps the last good snapshot
+                compiled = self.load_template(name, path, fallback=False)
+                if compiled is not None:
+                    templates[name] = compiled
+                    changed.append(name)
+            for name in list(templates):
+                if name not in files:
+                    del templates[name]
+                    self._stamps.pop(self.path_for(name), None)
+                    changed.append(name)
+            if changed:
+                self.templates = templates
+        for name in changed:
+            if name in templates:
+                logging.info(f"Reloaded template '{name}' (version {templates[name].version})")
+            else:
+                logging.info(f"Template '{name}' removed")
+        return changed
+
+    def get_paper_width(self):
+        return self.get().paper_width
+
+    def generate_receipt(self, data, name=None):
+        """Render a receipt as plain text."""
+        return self.get(name).generate_receipt(data)
+
+    def render_document(self, data, name=None):
+        """Render a receipt straight into a complete ESC/POS document."""
+        return self.get(name).render_document(data)
 
 class PrinterManager:
     def __init__(self):
         self.active_printer = None
+        self.printer_configs = {}
+        self._transports = {}
+        self._transports_lock = threading.Lock()
+        self.registry = PrinterRegistry(self.enumerate_printers)
+        self.router = PrinterRouter()
+        self.status_monitor = PrinterStatusMonitor(self.poll_status)
         self.load_printer_from_config()
+        self.router.ready_func = self.status_monitor.ready
 
     def load_printer_from_config(self):
         try:
             with open('mosys.json', 'r') as f:
                 config = json.load(f)
+                self.printer_configs = config.get('printers', {})
+                self.registry.ttl = config.get('printer_cache_ttl', self.registry.ttl)
                 printer_name = config.get('active_printer')
                 if printer_name:
-                    if self.set_printer(printer_name):
-                        logging.info(f"Printer loaded from config: {printer_name}")
-                    else:
-                        logging.warning(f"Printer '{printer_name}' from config not found or couldn't be set")
+                    # Checked once the printer list has loaded in the background,
+                    # so startup does not wait for EnumPrinters
+                    self.active_printer = printer_name
+                    threading.Thread(target=self._check_config_printer, args=(printer_name,),
+                                     name="printer-config-check", daemon=True).start()
                 else:
                     logging.warning("No active_printer found in mosys.json")
+                try:
+                    self.router = PrinterRouter(config)
+                except ValueError as e:
+                    logging.error(f"Invalid printer pools in mosys.json: {str(e)}")
+                self.status_monitor.interval = config.get('status_poll_interval', self.status_monitor.interval)
         except FileNotFoundError:
             logging.warning("mosys.json not found")
         except json.JSONDecodeError:
             logging.error("Invalid JSON in mosys.json")
 
+    def _check_config_printer(self, printer_name):
+        if printer_name in self.registry:
+            logging.info(f"Printer loaded from config: {printer_name}")
+        else:
+            logging.warning(f"Printer '{printer_name}' from config not found or couldn't be set")
+            if self.active_printer == printer_name:
+                self.active_printer = None
+
+    def enumerate_printers(self):
+        printers = list(self.printer_configs)
+        if win32print is not None:
+            printers.extend(printer[2] for printer in win32print.EnumPrinters(2)
+                            if printer[2] not in self.printer_configs)
+        return printers
+
     def get_printers(self):
-        return [printer[2] for printer in win32print.EnumPrinters(2)]
+        return self.registry.get_printers()
+
+    def refresh_printers(self):
+        self.registry.refresh(wait=True)
+        return self.registry.get_printers()
+
+    def get_transport(self, printer_name):
+        with self._transports_lock:
+            transport = self._transports.get(printer_name)
+            if transport is None:
+                transport = create_transport(printer_name, self.printer_configs.get(printer_name))
+                self._transports[printer_name] = transport
+            return transport
+
+    def check_printer(self, printer_name):
+        self.get_transport(printer_name).check()
+
+    def poll_status(self, printer_name):
+        return self.get_transport(printer_name).status()
+
+    def watched_printers(self):
+        """Printers whose status is polled: the active printer, configured printers and pool members."""
+        printers = [self.active_printer] if self.active_printer else []
+        for printer in itertools.chain(self.printer_configs, self.router.pooled_printers()):
+            if printer not in printers:
+                printers.append(printer)
+        return printers
+
+    def watch_printers(self):
+        for printer in self.watched_printers():
+            self.status_monitor.watch(printer)
+
+    def printer_status(self):
+        """Health, circuit breaker state, reported status and queue depth of every known printer."""
+        printers = self.get_printers()
+        printers.extend(printer for printer in self.router.pooled_printers() if printer not in printers)
+        statuses = self.router.status(printers)
+        for status in statuses:
+            status['printer_status'] = self.status_monitor.to_dict(status['name'])
+        return statuses
+
+    def route(self, fields, paper_size=None):
+        """Pick the printer for a request from its ``printer``/``station``/``paper_size`` fields.
+
+        Returns ``(printer_name, pool_name)``; ``pool_name`` is ``None`` when
+        the job is not going to a pool.
+        """
+        printer_name, pool_name = self.router.route(fields.get('printer'), fields.get('station'),
+                                                    fields.get('paper_size') or paper_size,
+                                                    self.active_printer)
+        if not printer_name:
+            raise RoutingError("No active printer selected. Check mosys.json configuration.")
+        if pool_name is None and printer_name != self.active_printer and printer_name not in self.registry:
+            raise RoutingError(f"Unknown printer '{printer_name}'")
+        return printer_name, pool_name
 
     def set_printer(self, printer_name):
-        if printer_name in self.get_printers():
+        if printer_name in self.registry:
             self.active_printer = printer_name
+            self.status_monitor.watch(printer_name)
             return True
         logging.warning(f"Printer '{printer_name}' not found")
         return False
 
-    def print_text(self, text):
-        if not self.active_printer:
+    def build_document(self, texts, codepage='cp437'):
+        """Build one RAW document from one or more plain-text receipts, cutting the paper after each."""
+        document = EscPosDocument(codepage)
+        for text in texts:
+            document.begin().line(text).end()
+        return document.getvalue()
+
+    def print_text(self, text, printer_name=None):
+        """Print one receipt, or a list of receipts as a single spool job.
+
+        ``bytes`` are taken as a complete document (``build_document`` or
+        ``ReceiptTemplate.render_document``) and sent as-is; a
+        ``StreamedReceipt`` is rendered while it is sent.
+        """
+        if isinstance(text, StreamedReceipt):
+            return self.print_stream(text, printer_name)
+        if isinstance(text, bytes):
+            document = text
+        else:
+            document = self.build_document(text if isinstance(text, list) else [text])
+        return self._send(printer_name, lambda transport: transport.send(document))
+
+    def print_stream(self, chunks, printer_name=None):
+        """Print a document given as an iterable of byte chunks, e.g. ``CompiledTemplate.iter_document``.
+
+        Each chunk goes to the printer as soon as it is produced, so a long
+        receipt starts printing while the rest is still being rendered.
+        """
+        return self._send(printer_name, lambda transport: transport.send_stream(chunks))
+
+    def _send(self, printer_name, send):
+        printer_name = printer_name or self.active_printer
+        if not printer_name:
             return "No active printer selected", 400
 
+        breaker = self.router.breaker(printer_name)
         try:
-            hPrinter = win32print.OpenPrinter(self.active_printer)
-            try:
-                hJob = win32print.StartDocPrinter(hPrinter, 1, ("Print Job", None, "RAW"))
-                try:
-                    win32print.StartPagePrinter(hPrinter)
-                    
-                    if isinstance(text, str):
-                        text = text.encode('utf-8', errors='replace')
-                    
-                    commands = b"\x1B\x40"  # Initialize printer
-                    commands += text
-                    commands += b"\x0A\x0D"  # New line
-                    commands += b"\x1D\x56\x41\x03"  # Cut paper
-                    
-                    win32print.WritePrinter(hPrinter, commands)
-                    
-                    win32print.EndPagePrinter(hPrinter)
-                finally:
-                    win32print.EndDocPrinter(hPrinter)
-            finally:
-                win32print.ClosePrinter(hPrinter)
+            with metrics.timer('send', printer_name):
+                status = send(self.get_transport(printer_name))
+            breaker.record_success()
+            if status is not None and not status.ready:
+                # The printer holds the job and prints it once it is ready again; failing the job
+                # would let failover or a client retry print it a second time elsewhere
+                logging.warning(f"Printer '{printer_name}' accepted the job but is not ready: {status.message}")
+                return f"Print job sent, printer not ready: {status.message}", 200
             return "Print job sent successfully", 200
         except Exception as e:
             error_msg = f"Error printing: {str(e)}"
             logging.error(error_msg)
+            breaker.record_failure(str(e))
             return error_msg, 500
+        finally:
+            # A job can run the paper out, ask for the status now instead of at the next poll
+            self.status_monitor.wake(printer_name)
+
+def lazy_singleton(factory):
+    """Return a getter that creates the shared instance on first use.
+
+    The GUI and the HTTP server share these instances, and nothing is read
+    from disk or enumerated until something actually needs it.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+    return get
+
+get_config = lazy_singleton(load_config)
+
+def create_receipt_template():
+    config = get_config()
+    receipt_template = ReceiptTemplate(config.get('template_dir', 'templates'), config.get('paper_dots'))
+    receipt_template.start_watching(config.get('template_reload_interval', 2))
+    return receipt_template
+
+get_receipt_template = lazy_singleton(create_receipt_template)
+get_printer_manager = lazy_singleton(PrinterManager)
 
-receipt_template = ReceiptTemplate()
-printer_manager = PrinterManager()
+def create_print_queue():
+    config = get_config()
+    manager = get_printer_manager()
+    router = manager.router
+    monitor = manager.status_monitor
+    queue = PrintQueue(manager.print_text,
+                       max_depth=config.get('queue_max_depth', 100),
+                       journal=JobJournal(config.get('journal_dir', 'print_journal'),
+                                          config.get('journal_segment_size', 1024 * 1024)),
+                       failover=router.failover,
+                       hold=monitor.hold_reason,
+                       restore=restore_receipt)
+    router.depth_func = queue.depth
+    router.start_health_checks(manager.check_printer)
+    monitor.busy_func = queue.printing
+    manager.watch_printers()
+    metrics.gauges['print_queue_depth'] = queue.depth
+    metrics.gauges['printer_available'] = lambda: {printer: int(router.available(printer))
+                                                   for printer in router.pooled_printers()}
+    metrics.gauges['printer_ready'] = lambda: {printer: int(monitor.ready(printer)) for printer in monitor.printers()}
+    queue.replay_journal()
+    return queue
+
+def restore_receipt(payload):
+    """Turn a journaled or cached ``StreamedReceipt.to_dict()`` back into a receipt to print."""
+    templates = get_receipt_template()
+    try:
+        template = templates.get(payload['template'])
+    except TemplateError:
+        logging.warning(f"Template '{payload['template']}' no longer exists, printing with the default template")
+        template = templates.get()
+    return StreamedReceipt(template, payload['data'])
+
+get_print_queue = lazy_singleton(create_print_queue)
+get_receipt_cache = lazy_singleton(lambda: ReceiptCache(get_config().get('receipt_cache_bytes', 8 * 1024 * 1024),
+                                                        spill_dir=get_config().get('receipt_cache_dir')))
+get_receipt_validator = lazy_singleton(lambda: ReceiptValidator(get_config().get('max_items', MAX_ITEMS)))
+get_preview_cache = lazy_singleton(lambda: PreviewCache(get_config().get('preview_cache_bytes', 4 * 1024 * 1024)))
+get_recent_submissions = lazy_singleton(lambda: RecentSubmissions(get_config().get('idempotency_window', 300)))
+submission_lock = threading.Lock()
+
+def find_duplicate(key, now):
+    """Return the job already accepted for ``key`` unless it failed, or ``None``."""
+    job_id = get_recent_submissions().get(key, now)
+    if job_id is None:
+        return None
+    job = get_print_queue().get_job(job_id)
+    if job is not None and job.status == 'failed':
+        return None
+    return job_id, (job.status if job else 'done')
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok"})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @app.route('/printers', methods=['GET'])
 def get_printers():
-    return jsonify(printer_manager.get_printers())
+    manager = get_printer_manager()
+    if request.args.get('refresh'):
+        manager.refresh_printers()
+    if request.args.get('health'):
+        get_print_queue()  # Queue depths come from the print queue
+        return jsonify(manager.printer_status())
+    return jsonify(manager.get_printers())
+
+@app.route('/printers/<name>/status', methods=['GET'])
+def get_printer_status(name):
+    manager = get_printer_manager()
+    if name not in manager.watched_printers() and name not in manager.registry:
+        return jsonify({"error": f"Unknown printer '{name}'"}), 404
+    if request.args.get('refresh'):
+        manager.status_monitor.poll(name)
+    return jsonify(dict(manager.status_monitor.to_dict(name), name=name))
 
 @app.route('/set_printer', methods=['POST'])
 def set_printer():
     printer_name = request.json.get('printer_name')
-    if printer_manager.set_printer(printer_name):
+    if get_printer_manager().set_printer(printer_name):
         return jsonify({"message": f"Printer set to {printer_name}"}), 200
     else:
         return jsonify({"error": "Invalid printer name"}), 400
 
+def job_meta(pool, **meta):
+    """Job metadata; jobs sent to a pool remember it so they can fail over within the pool."""
+    if pool:
+        meta['pool'] = pool
+    return meta
+
+def job_accepted(message, job, **extra):
+    """Response body for a queued job; ``held`` says why it waits when its printer is not ready."""
+    body = dict(message=message, job_id=job.id, status=job.status, **extra)
+    reason = get_printer_manager().status_monitor.hold_reason(job.printer)
+    if reason:
+        body['held'] = reason
+    return body
+
+def parse_receipt(fields, template=None):
+    """Validate a /print form or JSON body, or one /print/batch JSON object, into receipt data.
+
+    With a ``template`` the items are also checked for the custom item
+    fields it prints, so they are reported here instead of failing the job.
+    """
+    validator = get_receipt_validator()
+    with metrics.timer('parse_form'):
+        data, errors = validator.validate_fields(fields)
+    with metrics.timer('parse_items'):
+        data['items'] = validator.validate_items(fields.get('items', '[]'), errors)
+        if template is not None and not errors:
+            errors = template.item_field_errors(data['items'])
+    if errors:
+        raise validation_error(errors[:validator.max_errors])
+    return data
+
+def request_fields():
+    """The /print fields, from a JSON body or from form encoding."""
+    if request.is_json:
+        fields = request.get_json(silent=True)
+        if not isinstance(fields, dict):
+            raise ReceiptDataError("Expected a JSON object")
+        return fields
+    return request.form
+
+def default_printer():
+    """The printer a receipt without ``printer``/``station``/``paper_size`` fields goes to, or ``None``."""
+    try:
+        return get_printer_manager().route({}, get_receipt_template().template['paper_size'])[0]
+    except RoutingError:
+        return None
+
+def submit_receipt(fields, idempotency_key=None, job_id=None):
+    """Validate, render and queue one receipt; returns ``(body, status_code)``.
+
+    Shared by ``/print`` and the submission channel, so both go through the
+    same routing, rendering, idempotency and queue paths.
+    """
+    try:
+        # One snapshot for the whole request, a template saved meanwhile applies to the next receipt
+        template = get_receipt_template().get(fields.get('template'))
+        printer, pool = get_printer_manager().route(fields, template.template['paper_size'])
+    except TemplateError as e:
+        return {"error": str(e)}, 400
+    except RoutingError as e:
+        return {"error": str(e)}, e.status_code
+
+    try:
+        data = parse_receipt(fields, template)
+        # The same order code is printed with other templates or on other printers, e.g. a kitchen ticket
+        # next to the customer receipt; a pool counts as one destination, a retry may go to another member
+        code = data.get('code')
+        key = idempotency_key or (code and (code, template.name, pool or printer))
+        duplicate = find_duplicate(key, time.time()) if key else None
+        if duplicate:
+            job_id, status = duplicate
+            return {"message": "Duplicate receipt, already accepted", "job_id": job_id, "status": status}, 200
+
+        if len(data['items']) >= get_config().get('stream_min_items', STREAM_MIN_ITEMS):
+            # Rendered by the print worker while it is sent, the printer starts before the end is rendered.
+            # A replay or reprint renders it again, so the default date is taken now.
+            data.setdefault('tanggal', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            document = StreamedReceipt(template, data)
+        else:
+            with metrics.timer('render'):
+                document = template.render_document(data)
+        with submission_lock:
+            # Check again under the lock, a retry may have been accepted while rendering
+            duplicate = find_duplicate(key, time.time()) if key else None
+            if duplicate:
+                job_id, status = duplicate
+                return {"message": "Duplicate receipt, already accepted", "job_id": job_id, "status": status}, 200
+            job = get_print_queue().submit(printer, document, job_meta(pool, code=code), job_id)
+            if key:
+                get_recent_submissions().add(key, job.id, job.created_at)
+        if code:
+            if isinstance(document, StreamedReceipt):
+                get_receipt_cache().put(code, json.dumps(document.to_dict()).encode('utf-8'),
+                                        job.id, job.created_at, streamed=True)
+            else:
+                get_receipt_cache().put(code, document, job.id, job.created_at)
+        return job_accepted("Print job queued", job), 202
+    except QueueFullError as e:
+        metrics.inc('print_rejected_total', printer)
+        return {"error": str(e)}, 429
+    except ReceiptDataError as e:
+        return {"error": str(e), "fields": e.errors}, 400
+    except Exception as e:
+        return {"error": str(e)}, 500
+
 @app.route('/print', methods=['POST'])
 def print_receipt():
-    if not printer_manager.active_printer:
-        return jsonify({"error": "No active printer selected. Check mosys.json configuration."}), 400
-    
     try:
-        data = {
-            'nama_toko': request.form.get('nama_toko'),
-            'alamat_toko': request.form.get('alamat_toko'),
-            'no_hp': request.form.get('no_hp'),
-            'nama_kasir': request.form.get('nama_kasir'),
-            'code': request.form.get('code'),
-            'tanggal': request.form.get('tanggal'),
-            'items': json.loads(request.form.get('items', '[]')),
-            'notes': request.form.get('notes')
-        }
-        
-        if not data['nama_toko']:
-            return jsonify({"error": "No data provided"}), 400
-        
-        # Convert numeric values in items to float for proper formatting
-        for item in data['items']:
-            item['harga'] = float(item['harga'])
-            item['diskon'] = float(item['diskon'])
-            item['total_harga'] = float(item['total_harga'])
-        
-        receipt_text = receipt_template.generate_receipt(data)
-        result, status_code = printer_manager.print_text(receipt_text)
-        return jsonify({"message": result}), status_code
-    except json.JSONDecodeError:
-        return jsonify({"error": "Invalid JSON in 'items' field"}), 400
-    except ValueError:
-        return jsonify({"error": "Invalid numeric value in items"}), 400
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        fields = request_fields()
+    except ReceiptDataError as e:
+        return jsonify({"error": str(e)}), 400
+    body, status_code = submit_receipt(fields, request.headers.get('Idempotency-Key'))
+    return jsonify(body), status_code
+
+@app.route('/print/batch', methods=['POST'])
+def print_batch():
+    payloads = request.get_json(silent=True)
+    fields = request.args
+    if isinstance(payloads, dict):
+        fields = payloads
+        payloads = payloads.get('receipts')
+    try:
+        templates = get_receipt_template()
+        template = templates.get(fields.get('template'))
+        printer, pool = get_printer_manager().route(fields, template.template['paper_size'])
+    except TemplateError as e:
+        return jsonify({"error": str(e)}), 400
+    except RoutingError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    if not isinstance(payloads, list) or not payloads:
+        return jsonify({"error": "Expected a JSON array of receipts"}), 400
+
+    # Render every receipt; a bad payload is reported and skipped, the rest still print
+    results = []
+    receipts = []
+    for index, payload in enumerate(payloads):
+        result = {"index": index, "code": payload.get('code') if isinstance(payload, dict) else None}
+        try:
+            if not isinstance(payload, dict):
+                raise ReceiptDataError("Receipt must be a JSON object")
+            receipt_template = templates.get(payload['template']) if payload.get('template') else template
+            data = parse_receipt(payload, receipt_template)
+            with metrics.timer('render'):
+                receipts.append(receipt_template.render_document(data))
+            result["status"] = "queued"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+            if isinstance(e, ReceiptDataError):
+                result["fields"] = e.errors
+        results.append(result)
+
+    if not receipts:
+        return jsonify({"error": "No valid receipts in batch", "receipts": results}), 400
+
+    try:
+        job = get_print_queue().submit(printer, b''.join(receipts),
+                                       job_meta(pool, codes=[r['code'] for r in results if r['status'] == 'queued']))
+    except QueueFullError as e:
+        metrics.inc('print_rejected_total', printer)
+        return jsonify({"error": str(e)}), 429
+    queued = [result for result in results if result['status'] == 'queued']
+    for result, document in zip(queued, receipts):
+        result['job_id'] = job.id
+        if result['code']:
+            get_receipt_cache().put(result['code'], document, job.id, job.created_at)
+    return jsonify(job_accepted(f"{len(receipts)} of {len(payloads)} receipts queued", job, receipts=results)), 202
+
+@app.route('/reprint/<code>', methods=['POST'])
+def reprint_receipt(code):
+    try:
+        printer, pool = get_printer_manager().route(request.values, get_receipt_template().template['paper_size'])
+    except RoutingError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    cached = get_receipt_cache().get(code)
+    if cached is None:
+        return jsonify({"error": f"No cached receipt for code '{code}'"}), 404
+    entry, document = cached
+    if entry.streamed:
+        document = restore_receipt(json.loads(document))
+    try:
+        job = get_print_queue().submit(printer, document, job_meta(pool, code=code, reprint=True))
+    except QueueFullError as e:
+        metrics.inc('print_rejected_total', printer)
+        return jsonify({"error": str(e)}), 429
+    return jsonify(job_accepted("Reprint job queued", job)), 202
+
+def preview_format(fields):
+    preview_format = request.args.get('format') or fields.get('format')
+    if not preview_format:
+        preview_format = 'png' if request.accept_mimetypes.best_match(['text/plain', 'image/png']) == 'image/png' else 'text'
+    if preview_format not in PREVIEW_TYPES:
+        raise ReceiptDataError(f"Unknown preview format '{preview_format}' (use 'text' or 'png')")
+    return preview_format
+
+def preview_template(templates, template):
+    """The saved template named ``template``, or an unsaved one given as an object of template settings.
+
+    Returns ``(key, get)``: what identifies the template in the preview
+    cache, and a function compiling it, called only on a cache miss.
+    """
+    if isinstance(template, dict):
+        settings = dict(DEFAULT_TEMPLATE, **template)
+        return settings, lambda: templates.compile('preview', settings, strict=False, images=False)
+    compiled = templates.get(template)
+    return [compiled.name, compiled.version], lambda: compiled
+
+@app.route('/preview', methods=['POST'])
+def preview_receipt():
+    """Render a receipt as text or PNG without printing it; nothing is queued or cached for reprint."""
+    try:
+        fields = request_fields()
+        preview_type = preview_format(fields)
+        template_key, get_template = preview_template(get_receipt_template(), fields.get('template'))
+        data = parse_receipt(fields)
+    except ReceiptDataError as e:
+        return jsonify({"error": str(e), "fields": e.errors}), 400
+    except TemplateError as e:
+        return jsonify({"error": str(e)}), 400
+
+    key = preview_key(template_key, data, preview_type)
+    headers = {'Content-Type': PREVIEW_TYPES[preview_type], 'ETag': f'"{key}"', 'X-Preview-Cache': 'hit'}
+    if key in request.if_none_match:
+        return '', 304, headers
+    cache = get_preview_cache()
+    body = cache.get(key)
+    if body is None:
+        headers['X-Preview-Cache'] = 'miss'
+        try:
+            template = get_template()
+            errors = template.item_field_errors(data['items'])
+            if errors:
+                raise validation_error(errors[:get_receipt_validator().max_errors])
+            with metrics.timer('preview'):
+                body = render_preview(template, data, preview_type)
+        except ReceiptDataError as e:
+            return jsonify({"error": str(e), "fields": e.errors}), 400
+        except (TemplateError, ImageError) as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        cache.put(key, body)
+    return body, 200, headers
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    jobs = get_print_queue().list_jobs(request.args.get('status'))
+    return jsonify([job.to_dict() for job in jobs])
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_print_queue().get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/templates', methods=['GET'])
+def list_templates():
+    templates = get_receipt_template().templates
+    return jsonify([{"name": name, "version": template.version, "loaded_at": template.loaded_at,
+                     "paper_size": template.template['paper_size']}
+                    for name, template in sorted(templates.items())])
+
+@app.route('/templates/<name>', methods=['GET'])
+def get_template(name):
+    try:
+        template = get_receipt_template().get(name)
+    except TemplateError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"name": template.name, "version": template.version, "template": dict(template.template)})
 
 @app.route('/update_template', methods=['POST'])
 def update_template():
     new_template = request.json
     if not new_template:
         return jsonify({"error": "No template data provided"}), 400
+    name = new_template.pop('name', None) or DEFAULT_TEMPLATE_NAME
     
     try:
-        receipt_template.update_template(**new_template)
-        return jsonify({"message": "Template updated successfully"}), 200
+        compiled = get_receipt_template().update_template(name, **new_template)
+        return jsonify({"message": "Template updated successfully", "name": name, "version": compiled.version}), 200
+    except TemplateError as e:
+        return jsonify({"error": f"Invalid template: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": f"Failed to update template: {str(e)}"}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=1717)
\ No newline at end of file
+    from http_server import PrintServer
+    PrintServer(app, get_print_queue(), **get_config().get('server', {})).serve_forever()
\ No newline at end of file
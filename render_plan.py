@@ -0,0 +1,171 @@
+from string import Formatter
+
+from escpos import TextStyle, PLAIN, get_codepage
+
+_formatter = Formatter()
+
+# Sample values used to check format specs when a template is compiled
+SAMPLE_TEXT = 'abc'
+SAMPLE_NUMBER = 1
+
+HEADER_FIELDS = {'nama_toko': SAMPLE_TEXT, 'alamat_toko': SAMPLE_TEXT, 'no_hp': SAMPLE_TEXT}
+CASHIER_FIELDS = {'nama_kasir': SAMPLE_TEXT}
+CODE_FIELDS = {'code': SAMPLE_TEXT}
+DATE_FIELDS = {'tanggal': SAMPLE_TEXT}
+ITEM_FIELDS = {
+    'nama_produk': SAMPLE_TEXT,
+    'qty': SAMPLE_NUMBER,
+    'satuan': SAMPLE_TEXT,
+    'harga': SAMPLE_TEXT,
+    'diskon': SAMPLE_TEXT,
+    'total_harga': SAMPLE_TEXT
+}
+SUMMARY_FIELDS = {'total_item': SAMPLE_NUMBER, 'total_diskon': SAMPLE_TEXT, 'total_harga': SAMPLE_TEXT}
+FOOTER_FIELDS = {'notes': SAMPLE_TEXT}
+
+TEMPLATE_SECTIONS = {
+    'header_format': HEADER_FIELDS,
+    'cashier_format': CASHIER_FIELDS,
+    'code_format': CODE_FIELDS,
+    'date_format': DATE_FIELDS,
+    'item_format': ITEM_FIELDS,
+    'summary_format': SUMMARY_FIELDS,
+    'footer_format': FOOTER_FIELDS
+}
+
+STYLE_SECTIONS = ('header', 'cashier', 'code', 'date', 'separator', 'item', 'summary', 'footer')
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class FormatPlan:
+    """A template format string, checked once when the template is compiled.
+
+    Every field must be known and its format spec must work with a sample
+    value, so ``render(values)`` (``fmt.format_map``) cannot fail on a
+    receipt. ``custom_fields`` are field names allowed besides ``fields``;
+    their values are only known when a receipt prints, so
+    ``custom_field_errors`` checks them against their specs.
+    """
+
+    def __init__(self, section, fmt, fields, custom_fields=()):
+        self.section = section
+        self.fmt = fmt
+        self.custom_fields = tuple(custom_fields)
+        self.field_names = []
+        self.extra_specs = []
+        try:
+            parsed = list(_formatter.parse(fmt))
+        except ValueError as e:
+            raise TemplateError(f"{section}: {str(e)}")
+
+        for _, name, spec, conversion in parsed:
+            if name is None:
+                continue
+            if not name or not name.isidentifier():
+                raise TemplateError(f"{section}: unsupported field '{{{name}}}', use a plain field name")
+            if conversion not in (None, 'r', 's', 'a'):
+                raise TemplateError(f"{section}: unknown conversion '!{conversion}' in field '{{{name}}}'")
+            if spec and '{' in spec:
+                raise TemplateError(f"{section}: nested format spec in field '{{{name}}}' is not supported")
+            if name in fields:
+                try:
+                    format(self._convert(fields[name], conversion), spec)
+                except (ValueError, TypeError) as e:
+                    raise TemplateError(f"{section}: invalid format spec '{spec}' for field '{{{name}}}': {str(e)}")
+            elif name in self.custom_fields:
+                self.extra_specs.append((name, spec, conversion))
+            else:
+                allowed = ', '.join(sorted(fields))
+                hint = ", declare custom item fields in item_fields" if section == 'item_format' else ''
+                raise TemplateError(f"{section}: unknown field '{{{name}}}' (allowed: {allowed}{hint})")
+            self.field_names.append(name)
+        self.extra_fields = [name for name in dict.fromkeys(self.field_names) if name not in fields]
+        self.render = fmt.format_map
+
+    @staticmethod
+    def _convert(value, conversion):
+        if conversion == 'r':
+            return repr(value)
+        if conversion == 's':
+            return str(value)
+        if conversion == 'a':
+            return ascii(value)
+        return value
+
+    def custom_field_errors(self, values):
+        """``(field, message)`` for each custom field value that does not fit its format spec."""
+        for name, spec, conversion in self.extra_specs:
+            try:
+                format(self._convert(values[name], conversion), spec)
+            except (ValueError, TypeError) as e:
+                yield name, f"does not fit the item format: {str(e)}"
+
+
+def compile_item_fields(names):
+    """Check the template ``item_fields``: custom item fields the item lines may print."""
+    if names is None:
+        return ()
+    if not isinstance(names, list) or not all(isinstance(name, str) and name.isidentifier() for name in names):
+        raise TemplateError("item_fields: must be a list of field names")
+    return tuple(name for name in dict.fromkeys(names) if name not in ITEM_FIELDS)
+
+
+def compile_template(template, previous=None):
+    """Compile every format string of a template into a ``FormatPlan``.
+
+    Raises ``TemplateError`` for unknown fields or invalid format specs so a
+    broken template is rejected when it is saved instead of when it prints.
+    ``item_format`` may also use the custom fields listed in ``item_fields``.
+    Plans in ``previous`` whose format string is unchanged are reused, so
+    editing one section only recompiles that section.
+    """
+    plans = {}
+    previous = previous or {}
+    item_fields = compile_item_fields(template.get('item_fields'))
+    for section, fields in TEMPLATE_SECTIONS.items():
+        fmt = template.get(section)
+        if not isinstance(fmt, str):
+            raise TemplateError(f"{section}: format must be a string")
+        custom_fields = item_fields if section == 'item_format' else ()
+        plan = previous.get(section)
+        if plan is None or plan.fmt != fmt or plan.custom_fields != custom_fields:
+            plan = FormatPlan(section, fmt, fields, custom_fields)
+        plans[section] = plan
+    return plans
+
+
+def compile_styles(styles):
+    """Resolve the template ``styles`` section into a ``TextStyle`` per receipt section.
+
+    Example: ``{"header": {"align": "center", "bold": true, "double_height": true}}``.
+    Sections without a style print plain and left-aligned.
+    """
+    if not isinstance(styles, dict):
+        raise TemplateError("styles: must be an object")
+    compiled = {}
+    for section in STYLE_SECTIONS:
+        style = styles.get(section)
+        if not style:
+            compiled[section] = PLAIN
+            continue
+        unknown = set(style) - {'align', 'bold', 'double_height'}
+        if unknown:
+            raise TemplateError(f"styles.{section}: unknown option(s) {', '.join(sorted(unknown))}")
+        try:
+            compiled[section] = TextStyle(**style)
+        except ValueError as e:
+            raise TemplateError(f"styles.{section}: {str(e)}")
+    unknown = set(styles) - set(STYLE_SECTIONS)
+    if unknown:
+        raise TemplateError(f"styles: unknown section(s) {', '.join(sorted(unknown))}")
+    return compiled
+
+
+def compile_codepage(name):
+    try:
+        return get_codepage(name)
+    except ValueError as e:
+        raise TemplateError(f"codepage: {str(e)}")
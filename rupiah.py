@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def _format_rounded(amount):
+    formatted = f"{abs(amount):,}".replace(',', '.')
+    return '-' + formatted if amount < 0 else formatted
+
+
+def format_rupiah(amount):
+    """Format an amount the Indonesian way: '.' as thousands separator, no decimals.
+
+    Gives the same result as ``locale.currency(round(amount), grouping=True, symbol='')``
+    under the id_ID locale (with the decimals dropped), without depending on the
+    process-wide locale, so it is safe to call from any thread.
+    """
+    # Bulatkan ke bilangan bulat terdekat
+    return _format_rounded(round(amount))
+
+
+def format_rupiah_column(amounts):
+    """Format a whole column of amounts at once, e.g. every item's ``harga``."""
+    format_rounded = _format_rounded
+    return [format_rounded(round(amount)) for amount in amounts]
@@ -0,0 +1,335 @@
+"""Persistent job submission channel: newline-delimited JSON over TCP.
+
+A POS client keeps one connection open and pipelines print requests on it
+without waiting for the replies. Each line is one JSON object:
+
+    {"op": "print", "id": "r1", "receipt": {...same fields as a /print JSON body...}}
+    {"op": "ping", "id": "p1"}
+
+The server answers each request in order (``accepted`` or ``rejected``)
+and pushes ``job`` events (``held``, ``printing``, ``done``, ``failed``,
+and ``queued`` after a move to another printer) as the job progresses.
+
+Flow control is credit based: ``hello`` carries the first credits and
+every print request uses one; ``credit`` events grant more as jobs finish.
+The credits a client holds never exceed the free room in the queue of the
+printer it last printed to (before the first print, the printer a receipt
+without routing fields goes to), so a slow or stuck printer slows its
+clients down instead of filling the queue. When that room shrinks, e.g.
+because other clients filled the queue, a ``credit`` event with a negative
+``credits`` value withdraws the surplus. A print request sent without a
+credit is rejected with ``code`` 429; other rejections carry the status
+code ``/print`` would have answered with.
+"""
+import json
+import logging
+import queue
+import socket
+import threading
+import uuid
+
+from print_queue import JOB_DONE, JOB_FAILED, JOB_QUEUED
+
+DEFAULT_CHANNEL_CONFIG = {
+    'enabled': True,
+    'host': '0.0.0.0',
+    'port': 1718,
+    'credits': 32,
+    'max_line_bytes': 2 * 1024 * 1024
+}
+
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED)
+MAX_WRITE_BATCH = 64  # Events written to the socket with one sendall
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class ChannelConnection:
+    """One client connection, read on its own thread and written from a writer thread.
+
+    Job events arrive from print worker threads; they only go into the
+    outbox, so a client that reads slowly never blocks a printer.
+    """
+
+    def __init__(self, channel, sock, address):
+        self.channel = channel
+        self.sock = sock
+        self.address = address
+        self.outbox = queue.Queue()
+        self.outstanding = 0  # Accepted jobs that have not finished yet
+        self.credits = 0  # Granted credits the client has not used yet
+        self.printer = None  # Printer of the last accepted job
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        self.outbox.put(message)
+
+    def grant(self, event='credit'):
+        """Bring the client's credits to what its window and the printer queue allow.
+
+        The change is sent as a ``credit`` event; it is negative when the
+        queue room shrank below the credits the client still holds.
+        """
+        print_queue = self.channel.print_queue
+        printer = self.printer or self.channel.default_printer()
+        with self.lock:
+            credits = self.channel.credits - self.outstanding
+            if printer is not None:
+                credits = min(credits, print_queue.max_depth - print_queue.depth(printer))
+            credits = max(credits, 0)
+            grant = credits - self.credits
+            if grant == 0 and event == 'credit':
+                return
+            self.credits = credits
+        self.send({'event': event, 'credits': grant})
+
+    def run(self):
+        writer = threading.Thread(target=self._write_loop, name=f"channel-writer-{self.address[1]}", daemon=True)
+        writer.start()
+        self.grant('hello')
+        try:
+            self._read_loop()
+        finally:
+            self.outbox.put(None)
+            writer.join()
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _read_loop(self):
+        max_line_bytes = self.channel.max_line_bytes
+        with self.sock.makefile('rb') as rfile:
+            while True:
+                try:
+                    line = rfile.readline(max_line_bytes + 1)
+                except OSError:
+                    break
+                if not line:
+                    break
+                if len(line) > max_line_bytes:
+                    self.send({'event': 'error', 'error': f"Message longer than {max_line_bytes} bytes"})
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError as e:
+                    self.send({'event': 'error', 'error': f"Invalid JSON: {str(e)}"})
+                    continue
+                if not isinstance(message, dict):
+                    self.send({'event': 'error', 'error': "Expected a JSON object"})
+                    continue
+                self.handle(message)
+
+    def _write_loop(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+            batch = [message]
+            while len(batch) < MAX_WRITE_BATCH:
+                try:
+                    message = self.outbox.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    self.outbox.put(None)
+                    break
+                batch.append(message)
+            try:
+                self.sock.sendall(b''.join(encode(message) for message in batch))
+            except OSError:
+                # The client is gone; the reader notices and closes the connection
+                break
+
+    def handle(self, message):
+        op = message.get('op', 'print')
+        request_id = message.get('id')
+        if op == 'ping':
+            self.send({'event': 'pong', 'id': request_id})
+        elif op == 'print':
+            self.submit(request_id, message)
+        else:
+            self.send({'event': 'rejected', 'id': request_id, 'code': 400, 'error': f"Unknown op '{op}'"})
+
+    def submit(self, request_id, message):
+        receipt = message.get('receipt')
+        if not isinstance(receipt, dict):
+            self.send({'event': 'rejected', 'id': request_id, 'code': 400,
+                       'error': "'receipt' must be a JSON object"})
+            return
+        with self.lock:
+            if self.credits <= 0:
+                rejected = True
+            else:
+                rejected = False
+                self.credits -= 1
+                self.outstanding += 1
+        if rejected:
+            self.send({'event': 'rejected', 'id': request_id, 'code': 429,
+                       'error': "No credits left, wait for a credit event"})
+            return
+
+        job_id = uuid.uuid4().hex
+        # Registered before the job exists, so no event of a fast job is missed
+        self.channel.register(job_id, self, request_id)
+        body, status_code = self.channel.submit(receipt, message.get('idempotency_key'), job_id)
+        if status_code == 202:
+            job = self.channel.print_queue.get_job(job_id)
+            if job is not None:
+                self.printer = job.printer
+            self.send(dict(body, event='accepted', id=request_id))
+            self.channel.accepted(job_id)
+            return
+        # Rejected or a duplicate of an earlier receipt: this request has no job to wait for
+        self.channel.unregister(job_id)
+        with self.lock:
+            self.outstanding -= 1
+        if status_code == 200:
+            self.send(dict(body, event='accepted', id=request_id, duplicate=True))
+        else:
+            self.send(dict(body, event='rejected', id=request_id, code=status_code))
+        self.grant()
+
+    def job_finished(self):
+        with self.lock:
+            self.outstanding -= 1
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class SubmissionChannel:
+    """NDJSON-over-TCP server feeding ``submit(fields, idempotency_key, job_id)`` (see ``submit_receipt``).
+
+    ``default_printer()`` names the printer a receipt without routing fields
+    goes to, or ``None``; it caps the credits of clients that have not
+    printed yet.
+    """
+
+    def __init__(self, submit, print_queue, host='0.0.0.0', port=1718, credits=32,
+                 max_line_bytes=2 * 1024 * 1024, default_printer=None):
+        self.submit = submit
+        self.print_queue = print_queue
+        self.default_printer = default_printer or (lambda: None)
+        self.host = host
+        self.port = port
+        self.credits = credits
+        self.max_line_bytes = max_line_bytes
+        self._owners = {}  # job_id -> [connection, request id, events held back until 'accepted' or None]
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        print_queue.add_listener(self.job_changed)
+
+    def start(self):
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, name="submission-channel", daemon=True)
+        self._thread.start()
+        logging.info(f"Submission channel listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        try:
+            # Wakes up the accept() call, close() alone does not on Linux
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        self._server = None
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+
+    def _accept_loop(self):
+        server = self._server
+        while True:
+            try:
+                sock, address = server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = ChannelConnection(self, sock, address)
+            with self._lock:
+                self._connections.add(connection)
+            threading.Thread(target=self._serve, args=(connection,),
+                             name=f"channel-reader-{address[1]}", daemon=True).start()
+
+    def _serve(self, connection):
+        logging.info(f"Submission channel client connected from {connection.address[0]}")
+        try:
+            connection.run()
+        except Exception as e:
+            logging.error(f"Submission channel connection failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+                # Jobs keep printing, their events just have nobody to go to
+                for job_id in [job_id for job_id, owner in self._owners.items() if owner[0] is connection]:
+                    del self._owners[job_id]
+            logging.info(f"Submission channel client {connection.address[0]} disconnected")
+
+    def connections(self):
+        with self._lock:
+            return len(self._connections)
+
+    def register(self, job_id, connection, request_id):
+        with self._lock:
+            self._owners[job_id] = [connection, request_id, []]
+
+    def unregister(self, job_id):
+        with self._lock:
+            self._owners.pop(job_id, None)
+
+    def accepted(self, job_id):
+        """The ``accepted`` reply is out; send the job events that came in before it."""
+        with self._lock:
+            owner = self._owners.get(job_id)
+            if owner is None:
+                return
+            connection, _, held_back = owner
+            owner[2] = None
+            for event in held_back:
+                connection.send(event)
+                if event['status'] in FINISHED_STATUSES:
+                    del self._owners[job_id]
+
+    def job_changed(self, job):
+        """``PrintQueue`` listener, called from HTTP and print worker threads."""
+        if job.status == JOB_QUEUED and not job.message:
+            # Newly submitted; the 'accepted' reply reports that
+            return
+        finished = job.status in FINISHED_STATUSES
+        with self._lock:
+            owner = self._owners.get(job.id)
+            if owner is None:
+                return
+            connection, request_id, held_back = owner
+            event = {'event': 'job', 'id': request_id, 'job_id': job.id, 'status': job.status,
+                     'printer': job.printer, 'message': job.message}
+            if held_back is not None:
+                # Forgotten by accepted() once the finished event is sent
+                held_back.append(event)
+            else:
+                connection.send(event)
+                if finished:
+                    del self._owners[job.id]
+        if finished:
+            connection.job_finished()
+            # A finished job frees queue room, possibly for any client
+            with self._lock:
+                connections = list(self._connections)
+            for other in connections:
+                other.grant()